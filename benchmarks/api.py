@@ -0,0 +1,98 @@
+try:
+    from django.conf.urls import include, url
+except ImportError:
+    # Django < 1.4
+    from django.conf.urls.defaults import include, url
+
+from tastypie.api import Api
+from tastypie.authorization import Authorization
+from tastypie.constants import ALL
+from tastypie.fields import ToOneField
+
+from mangopie.fields import ReferenceList
+from mangopie.instrumentation import QueryInstrumentation
+from mangopie.resources import DocumentResource
+
+from benchmarks.documents import Author, Entry, Keyword
+
+# The runner sets the callback to collect the query counts of every request.
+instrumentation = QueryInstrumentation(headers=False, n_plus_one_threshold=0)
+
+ENTRY_FILTERING = {
+    'title': ALL,
+    'views': ALL,
+    'created': ALL,
+    'tags': ALL,
+    'author': ALL,
+}
+
+class AuthorResource(DocumentResource):
+    class Meta:
+        queryset = Author.objects()
+        resource_name = 'author'
+        instrumentation = instrumentation
+
+class KeywordResource(DocumentResource):
+    class Meta:
+        queryset = Keyword.objects()
+        resource_name = 'keyword'
+        instrumentation = instrumentation
+
+class FlatEntryResource(DocumentResource):
+    """
+    Entries without relations or embedded documents.
+    """
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'flat_entry'
+        excludes = ['comments']
+        instrumentation = instrumentation
+
+class EntryResource(DocumentResource):
+    """
+    Entries with references as URIs and embedded comments.
+    """
+    author = ToOneField(AuthorResource, 'author')
+    keywords = ReferenceList(KeywordResource, 'keywords')
+
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'entry'
+        authorization = Authorization()
+        filtering = ENTRY_FILTERING
+        ordering = ['views', 'created']
+        instrumentation = instrumentation
+
+class FullEntryResource(DocumentResource):
+    """
+    Entries with full related resources, fetched one by one.
+    """
+    author = ToOneField(AuthorResource, 'author', full=True)
+    keywords = ReferenceList(KeywordResource, 'keywords', full=True)
+
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'full_entry'
+        instrumentation = instrumentation
+
+class BatchedEntryResource(DocumentResource):
+    """
+    Entries with full related resources, fetched per page.
+    """
+    author = ToOneField(AuthorResource, 'author', full=True)
+    keywords = ReferenceList(KeywordResource, 'keywords', full=True)
+
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'batched_entry'
+        batch_dereference = True
+        instrumentation = instrumentation
+
+v1 = Api(api_name='v1')
+
+for resource_class in (AuthorResource, KeywordResource, FlatEntryResource, EntryResource, FullEntryResource, BatchedEntryResource):
+    v1.register(resource_class())
+
+urlpatterns = [
+    url(r'^api/', include(v1.urls)),
+]
@@ -0,0 +1,33 @@
+"""
+Compares two result files of ``benchmarks.run``::
+
+    python -m benchmarks.compare before.json after.json
+"""
+import json
+import sys
+
+def load(path):
+    with open(path) as result_file:
+        return json.load(result_file)
+
+def main(argv=None):
+    argv = argv or sys.argv[1:]
+
+    if len(argv) != 2:
+        sys.exit(__doc__)
+
+    before, after = load(argv[0]), load(argv[1])
+    print '%-24s %12s %12s %8s %12s %12s' % ('case', 'p50 before', 'p50 after', 'change', 'queries', 'throughput')
+
+    for name in sorted(set(before['cases']) & set(after['cases'])):
+        old, new = before['cases'][name], after['cases'][name]
+        old_p50, new_p50 = old['latency_ms']['p50'], new['latency_ms']['p50']
+        queries = new.get('mongo', {}).get('queries_per_request')
+
+        print '%-24s %10.2fms %10.2fms %+7.1f%% %12s %10.1f/s' % (
+            name, old_p50, new_p50, (new_p50 - old_p50) / old_p50 * 100,
+            '-' if queries is None else '%.1f' % queries, new['throughput'],
+        )
+
+if __name__ == '__main__':
+    main()
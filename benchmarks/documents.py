@@ -0,0 +1,36 @@
+import datetime
+
+from mongoengine import Document, EmbeddedDocument
+from mongoengine import DateTimeField, EmbeddedDocumentField, IntField, ListField, ReferenceField, StringField
+
+class Author(Document):
+    name = StringField(max_length=128)
+
+    def __unicode__(self):
+        return self.name
+
+class Keyword(Document):
+    keyword = StringField(max_length=128)
+
+    def __unicode__(self):
+        return self.keyword
+
+class Comment(EmbeddedDocument):
+    text = StringField()
+    likes = IntField(default=0)
+
+class Entry(Document):
+    title = StringField(max_length=125)
+    views = IntField(default=0)
+    created = DateTimeField(default=datetime.datetime.utcnow)
+    tags = ListField(StringField(max_length=20))
+    author = ReferenceField(Author)
+    keywords = ListField(ReferenceField(Keyword))
+    comments = ListField(EmbeddedDocumentField(Comment))
+
+    meta = {
+        'indexes': ['views', 'tags', 'author', '-created'],
+    }
+
+    def __unicode__(self):
+        return self.title
@@ -0,0 +1,65 @@
+import datetime
+import itertools
+import random
+
+from bson import ObjectId
+
+from benchmarks.documents import Author, Entry, Keyword
+
+SIZES = {
+    '1k': 1000,
+    '100k': 100000,
+    '1m': 1000000,
+}
+
+TAGS = ['python', 'mongodb', 'django', 'tastypie', 'api', 'rest', 'json', 'bson', 'index', 'query']
+
+def _insert(document_type, documents, batch_size):
+    collection = document_type._get_collection()
+
+    while True:
+        batch = list(itertools.islice(documents, batch_size))
+
+        if not batch:
+            break
+
+        collection.insert_many(batch, ordered=False)
+
+def is_loaded(size):
+    """
+    Returns if the database already holds the fixtures for ``size`` entries.
+    """
+    return Entry.objects.count() == size
+
+def load(size, seed=0, batch_size=10000):
+    """
+    Replaces the benchmark collections with ``size`` entries, one author per
+    100 entries and 1000 keywords. Every entry has three tags, three keywords
+    and five embedded comments. The data only depends on ``seed``.
+    """
+    rnd = random.Random(seed)
+
+    for document_type in (Author, Keyword, Entry):
+        document_type.drop_collection()
+
+    author_ids = [ObjectId() for i in xrange(max(size // 100, 1))]
+    keyword_ids = [ObjectId() for i in xrange(1000)]
+    now = datetime.datetime(2026, 1, 1)
+
+    _insert(Author, ({'_id': pk, 'name': 'Author %s' % i} for i, pk in enumerate(author_ids)), batch_size)
+    _insert(Keyword, ({'_id': pk, 'keyword': 'keyword-%s' % i} for i, pk in enumerate(keyword_ids)), batch_size)
+
+    entries = ({
+        'title': 'Entry %s' % i,
+        'views': rnd.randint(0, 100000),
+        'created': now - datetime.timedelta(minutes=i),
+        'tags': rnd.sample(TAGS, 3),
+        'author': rnd.choice(author_ids),
+        'keywords': rnd.sample(keyword_ids, 3),
+        'comments': [{'text': 'Comment %s' % j, 'likes': rnd.randint(0, 100)} for j in xrange(5)],
+    } for i in xrange(size))
+
+    _insert(Entry, entries, batch_size)
+
+    for document_type in (Author, Keyword, Entry):
+        document_type.ensure_indexes()
@@ -0,0 +1,283 @@
+"""
+Benchmarks mangopie's read and write paths.
+
+Usage::
+
+    python -m benchmarks.run --size 1k --output results.json
+    python -m benchmarks.run --size 100k --host mongodb://localhost:27017 --reuse
+    python -m benchmarks.run --size 1k --mongomock
+
+Every case is run ``--iterations`` times after ``--warmup`` runs. The
+results (throughput, latency percentiles, memory and MongoDB queries per
+operation) are written as JSON. Query counts need a real ``mongod``, they
+are ``0`` with mongomock.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django
+
+if hasattr(django, 'setup'):
+    django.setup()
+
+from django.core.urlresolvers import resolve
+from django.test.client import RequestFactory
+
+import mongoengine
+import pymongo
+import tastypie
+
+from pymongo import monitoring
+
+from mangopie.instrumentation import CommandLogger
+from mangopie.resources import DocumentDeclarativeMetaclass, DocumentResource
+
+from benchmarks import fixtures
+from benchmarks.documents import Author, Entry, Keyword
+
+factory = RequestFactory()
+
+def percentile(values, percent):
+    """
+    Returns the ``percent`` percentile of the sorted ``values`` (nearest
+    rank).
+    """
+    if not values:
+        return None
+
+    index = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[max(min(index, len(values) - 1), 0)]
+
+def max_rss():
+    """
+    Returns the peak resident memory of the process in KB.
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # macOS reports bytes.
+    if sys.platform == 'darwin':
+        rss //= 1024
+
+    return rss
+
+def call(request):
+    """
+    Sends ``request`` through the URL resolver to its resource.
+    """
+    match = resolve(request.path)
+    response = match.func(request, *match.args, **match.kwargs)
+
+    if response.status_code >= 400:
+        raise RuntimeError("%s %s failed with %s: %s" % (request.method, request.path, response.status_code, response.content[:500]))
+
+    # Consume streamed responses.
+    if getattr(response, 'streaming', False):
+        for chunk in response:
+            pass
+
+    return response
+
+def get(path):
+    return lambda: call(factory.get(path, HTTP_ACCEPT='application/json'))
+
+class Cases(object):
+    """
+    The benchmarked operations. Every ``case_<name>`` method returns a
+    function that runs the operation once.
+    """
+    def __init__(self, size, seed=0):
+        self.size = size
+        self.random = random.Random(seed)
+        self.entry_ids = [str(pk) for pk in Entry.objects.order_by('id').limit(1000).scalar('id')]
+        self.author_ids = [str(pk) for pk in Author.objects.limit(100).scalar('id')]
+        self.keyword_ids = [str(pk) for pk in Keyword.objects.limit(100).scalar('id')]
+
+    def entry_id(self):
+        return self.random.choice(self.entry_ids)
+
+    def entry_data(self):
+        return json.dumps({
+            'title': 'Benchmark entry',
+            'views': self.random.randint(0, 100000),
+            'tags': ['python', 'benchmark'],
+            'author': '/api/v1/author/%s/' % self.random.choice(self.author_ids),
+            'keywords': ['/api/v1/keyword/%s/' % pk for pk in self.random.sample(self.keyword_ids, 3)],
+        })
+
+    def case_list_flat(self):
+        return get('/api/v1/flat_entry/')
+
+    def case_list(self):
+        return get('/api/v1/entry/')
+
+    def case_list_full(self):
+        return get('/api/v1/full_entry/')
+
+    def case_list_full_batched(self):
+        return get('/api/v1/batched_entry/')
+
+    def case_list_deep_offset(self):
+        return get('/api/v1/flat_entry/?offset=%s' % max(self.size - 20, 0))
+
+    def case_detail(self):
+        return lambda: call(factory.get('/api/v1/entry/%s/' % self.entry_id(), HTTP_ACCEPT='application/json'))
+
+    def case_detail_full(self):
+        return lambda: call(factory.get('/api/v1/full_entry/%s/' % self.entry_id(), HTTP_ACCEPT='application/json'))
+
+    def case_filters(self):
+        return get('/api/v1/entry/?views__gte=50000&views__lt=60000&tags=python&tags__in=api,json&title__startswith=Entry&order_by=-views')
+
+    def case_create(self):
+        return lambda: call(factory.post('/api/v1/entry/', data=self.entry_data(), content_type='application/json'))
+
+    def case_update(self):
+        return lambda: call(factory.put('/api/v1/entry/%s/' % self.entry_id(), data=self.entry_data(), content_type='application/json'))
+
+    def case_class_creation(self):
+        counter = [0]
+
+        def create_class():
+            counter[0] += 1
+
+            class Meta:
+                queryset = Entry.objects()
+                resource_name = 'entry_%s' % counter[0]
+
+            DocumentDeclarativeMetaclass('BenchmarkEntryResource', (DocumentResource,), {'Meta': Meta})
+
+        return create_class
+
+    @classmethod
+    def names(cls):
+        return sorted(name[len('case_'):] for name in dir(cls) if name.startswith('case_'))
+
+def measure(operation, iterations, warmup, instrumentation):
+    """
+    Runs ``operation`` and returns its throughput, latencies, memory use and
+    queries per run (collected by ``instrumentation``).
+    """
+    stats = []
+    instrumentation.callback = lambda resource, request, query_stats: stats.append(query_stats.get_totals())
+
+    for i in xrange(warmup):
+        operation()
+
+    del stats[:]
+    gc.collect()
+    rss_before = max_rss()
+    latencies = []
+    started = time.time()
+
+    for i in xrange(iterations):
+        operation_started = time.time()
+        operation()
+        latencies.append((time.time() - operation_started) * 1000)
+
+    duration = time.time() - started
+    instrumentation.callback = None
+    latencies.sort()
+
+    result = {
+        'iterations': iterations,
+        'duration': duration,
+        'throughput': iterations / duration if duration else None,
+        'latency_ms': {
+            'mean': sum(latencies) / len(latencies),
+            'min': latencies[0],
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': latencies[-1],
+        },
+        'memory_kb': {
+            'peak_rss': max_rss(),
+            'peak_rss_growth': max_rss() - rss_before,
+        },
+    }
+
+    if stats:
+        result['mongo'] = dict(
+            ('%s_per_request' % key, sum(totals[key] for totals in stats) / float(len(stats)))
+            for key in ('queries', 'time', 'documents')
+        )
+
+    return result
+
+def connect(args):
+    if args.mongomock:
+        mongoengine.connect(args.db, host='mongomock://localhost')
+        return None
+
+    # Commands are only counted if the listener exists before the client.
+    monitoring.register(CommandLogger())
+    connection = mongoengine.connect(args.db, host=args.host)
+    return connection.server_info().get('version')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks mangopie's read and write paths.")
+    parser.add_argument('--size', choices=sorted(fixtures.SIZES), default='1k', help="Number of entries.")
+    parser.add_argument('--host', default='mongodb://localhost:27017', help="MongoDB URI.")
+    parser.add_argument('--db', default='mangopie_benchmarks', help="Database to use, its collections are replaced.")
+    parser.add_argument('--mongomock', action='store_true', help="Use mongomock instead of a mongod.")
+    parser.add_argument('--reuse', action='store_true', help="Keep the fixtures if the database already holds them.")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--cases', nargs='+', choices=Cases.names(), default=Cases.names())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="File to write the JSON results to, stdout by default.")
+    args = parser.parse_args(argv)
+
+    server_version = connect(args)
+
+    # The resources evaluate their querysets when they are declared, which
+    # needs the connection.
+    from benchmarks import api
+
+    size = fixtures.SIZES[args.size]
+
+    if not (args.reuse and fixtures.is_loaded(size)):
+        started = time.time()
+        fixtures.load(size, seed=args.seed)
+        sys.stderr.write("Loaded %s entries in %.1fs.\n" % (size, time.time() - started))
+
+    cases = Cases(size, seed=args.seed)
+    results = {}
+
+    for name in args.cases:
+        sys.stderr.write("Running %s...\n" % name)
+        results[name] = measure(getattr(cases, 'case_%s' % name)(), args.iterations, args.warmup, api.instrumentation)
+
+    output = json.dumps({
+        'size': size,
+        'backend': 'mongomock' if args.mongomock else 'mongod',
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'versions': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'tastypie': getattr(tastypie, '__version__', None),
+            'mongoengine': mongoengine.get_version(),
+            'pymongo': pymongo.version,
+            'mongodb': server_version,
+        },
+        'iterations': args.iterations,
+        'cases': results,
+    }, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(output)
+    else:
+        print output
+
+if __name__ == '__main__':
+    main()
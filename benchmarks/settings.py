@@ -0,0 +1,26 @@
+# Minimal Django settings for the benchmarks.
+
+DEBUG = False
+
+SECRET_KEY = 'mangopie-benchmarks'
+
+ROOT_URLCONF = 'benchmarks.api'
+
+INSTALLED_APPS = (
+    'django.contrib.contenttypes',
+    'django.contrib.auth',
+    'tastypie',
+)
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
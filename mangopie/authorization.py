@@ -1,23 +1,98 @@
 import sys
 
+from django.core.cache import cache
+
 from tastypie.authorization import Authorization
 
+# Maps request methods to the django auth permission they require.
+PERMISSION_CODES = {
+    'POST': '%s.add_%s',
+    'PUT': '%s.change_%s',
+    'DELETE': '%s.delete_%s',
+}
+
+# Permission codes resolved per document or model class.
+_permission_codes = {}
+
 class DjangoAuthorization(Authorization):
     """
     Uses permission checking from ``django.contrib.auth`` to map ``POST``,
     ``PUT``, and ``DELETE`` to their equivalent django auth permissions.
-    
+
     This version of DjangoAuthorization works with mongoengine documents
     and django models.
+
+    The permission codes are resolved once per class and every permission of
+    a user is checked once per request. With ``permission_cache_timeout``
+    the answers are also kept in django's cache for that many seconds.
     """
+    def __init__(self, permission_cache_timeout=0):
+        self.permission_cache_timeout = permission_cache_timeout
+
     def _app_and_module_for_klass(self, klass):
         module_name = klass.__name__.lower()
-        
+
         model_module = sys.modules[klass.__module__]
         app_label = model_module.__name__.split('.')[-2]
-        
+
         return (app_label, module_name)
-    
+
+    def permission_codes_for_klass(self, klass):
+        """
+        Returns the permission codes for ``klass`` keyed by request method.
+        """
+        try:
+            return _permission_codes[klass]
+        except KeyError:
+            pass
+
+        try:
+            app_and_module = (klass._meta.app_label, klass._meta.module_name)
+        except AttributeError:
+            # if klass._meta is missing app_label and module_name
+            # this is most likely a mongoengine document. Figure it
+            # out manually then.
+            app_and_module = self._app_and_module_for_klass(klass)
+
+        permission_codes = dict(
+            (method, permission_code % app_and_module)
+            for method, permission_code in PERMISSION_CODES.items()
+        )
+        _permission_codes[klass] = permission_codes
+        return permission_codes
+
+    def has_perm(self, request, permission_code):
+        """
+        Returns if the user of ``request`` has ``permission_code``.
+
+        Asks ``user.has_perm``, so every auth backend is consulted, and
+        remembers the answer for the rest of the request.
+        """
+        permissions = getattr(request, '_mangopie_permissions', None)
+
+        if permissions is None:
+            permissions = request._mangopie_permissions = {}
+
+        if permission_code in permissions:
+            return permissions[permission_code]
+
+        user = request.user
+        cache_key = 'mangopie:permission:%s:%s' % (user.pk, permission_code)
+        use_cache = self.permission_cache_timeout and user.pk is not None
+        has_perm = None
+
+        if use_cache:
+            has_perm = cache.get(cache_key)
+
+        if has_perm is None:
+            has_perm = user.has_perm(permission_code)
+
+            if use_cache:
+                cache.set(cache_key, has_perm, self.permission_cache_timeout)
+
+        permissions[permission_code] = has_perm
+        return has_perm
+
     def is_authorized(self, request, object=None):
         # GET is always allowed
         if request.method == 'GET':
@@ -29,27 +104,41 @@ class DjangoAuthorization(Authorization):
         if not klass:
             return True
 
-        permission_codes = {
-            'POST': '%s.add_%s',
-            'PUT': '%s.change_%s',
-            'DELETE': '%s.delete_%s',
-        }
+        permission_codes = self.permission_codes_for_klass(klass)
 
         # cannot map request method to permission code name
         if request.method not in permission_codes:
             return False
-        
-        try:
-            permission_code = permission_codes[request.method] % (klass._meta.app_label, klass._meta.module_name)
-        except AttributeError:
-            # if klass._meta is missing app_label and module_name
-            # this is most likely a mongoengine document. Figure it
-            # out manually then.
-            permission_code = permission_codes[request.method] % self._app_and_module_for_klass(klass)
 
         # user must be logged in to check permissions
         # authentication backend must set request.user
         if not hasattr(request, 'user'):
             return False
 
-        return request.user.has_perm(permission_code)
\ No newline at end of file
+        return self.has_perm(request, permission_codes[request.method])
+
+    def limit_filters(self, request):
+        """
+        Returns filters that limit the objects the user of ``request`` can
+        access. Override it to e.g. limit users to their own documents.
+        """
+        return {}
+
+    def apply_limits(self, request, object_list):
+        """
+        Limits ``object_list`` with a single query instead of checking every
+        object on its own.
+
+        The request method is not checked here, ``dispatch`` already did that
+        for the requested resource. Related resources read their objects with
+        the same request, e.g. while a ``POST`` resolves its references.
+        """
+        if request is None:
+            return object_list
+
+        filters = self.limit_filters(request)
+
+        if filters:
+            object_list = object_list.filter(**filters)
+
+        return object_list
@@ -0,0 +1,227 @@
+import hashlib
+import time
+
+from django.http import HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+try:
+    from django.core.cache import caches
+
+    def _get_cache(name):
+        return caches[name]
+except ImportError:
+    # Django < 1.7
+    from django.core.cache import get_cache as _get_cache
+
+from tastypie import http
+
+from mongoengine import signals
+
+# Resource classes using a ``ResponseCache``.
+_resources = {}
+_connected = False
+
+def _connect():
+    """
+    Connects the receiver invalidating cached responses to the signals of
+    all documents, so every process invalidates, also those that never
+    served a cached response.
+    """
+    global _connected
+
+    if _connected or not signals.signals_available:
+        return
+
+    signals.post_save.connect(_document_changed, weak=False)
+    signals.post_delete.connect(_document_changed, weak=False)
+    _connected = True
+
+def _document_changed(sender, document, **kwargs):
+    if _resources:
+        invalidate(sender, document.pk)
+
+def invalidate(document_type, pk=None):
+    """
+    Invalidates the cached responses of all resources that show documents of
+    ``document_type``.
+
+    Responses of the resource for ``document_type`` itself are invalidated
+    precisely: all lists and the detail of ``pk`` (all details without a
+    ``pk``). Resources that embed or reference ``document_type`` drop all
+    their cached responses.
+    """
+    for resource_class, response_cache in _resources.items():
+        object_class = resource_class._meta.object_class
+
+        if issubclass(document_type, object_class):
+            response_cache.bump(resource_class, 'list')
+
+            if pk is None:
+                response_cache.bump(resource_class)
+            else:
+                response_cache.bump(resource_class, str(pk))
+        elif document_type in response_cache.dependencies(resource_class):
+            response_cache.bump(resource_class)
+
+class ResponseCache(object):
+    """
+    Caches the serialized ``GET`` responses of a ``DocumentResource`` in one
+    of Django's cache backends.
+
+    Responses are sent with ``ETag`` and ``Last-Modified`` headers and
+    conditional requests are answered with ``304 Not Modified``. Cached
+    responses are invalidated by mongoengine's ``post_save`` and
+    ``post_delete`` signals (which need blinker), including those of
+    documents the resource embeds or references.
+
+    ``timeout`` is the time in seconds a response is cached, responses larger
+    than ``max_size`` bytes are not cached. With ``vary_on_user`` every user
+    gets their own cached responses, use it if authorization limits what
+    users see.
+    """
+    def __init__(self, timeout=300, max_size=512 * 1024, cache_name='default', vary_on_user=False):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.cache_name = cache_name
+        self.vary_on_user = vary_on_user
+        self._dependencies = {}
+
+    @property
+    def cache(self):
+        return _get_cache(self.cache_name)
+
+    def register(self, resource_class):
+        """
+        Registers ``resource_class`` for invalidation. ``DocumentResource``
+        does it when the class is created.
+        """
+        _resources[resource_class] = self
+        _connect()
+
+    def dependencies(self, resource_class, seen=None):
+        """
+        Returns the document classes embedded or referenced by the fields of
+        ``resource_class`` (and their resources).
+
+        They are looked up when a document changes for the first time, when
+        all related resources can be imported.
+        """
+        if seen is None:
+            try:
+                return self._dependencies[resource_class]
+            except KeyError:
+                self._dependencies[resource_class] = self.dependencies(resource_class, set())
+                return self._dependencies[resource_class]
+
+        from mangopie import fields
+
+        seen.add(resource_class)
+        document_types = set()
+
+        for field_object in resource_class.base_fields.values():
+            if isinstance(field_object, fields.ListField):
+                field_object = field_object.inner_field
+
+            if isinstance(field_object, fields.EmbeddedResourceField):
+                related_class = field_object.resource_type
+            elif getattr(field_object, 'is_related', False):
+                related_class = field_object.to_class
+            else:
+                continue
+
+            document_type = getattr(related_class._meta, 'object_class', None)
+
+            if document_type is not None:
+                document_types.add(document_type)
+
+            if not related_class in seen and hasattr(related_class, 'base_fields'):
+                document_types.update(self.dependencies(related_class, seen))
+
+        return document_types
+
+    def _generation_key(self, resource_class, scope):
+        return 'mangopie:generation:%s.%s:%s' % (resource_class.__module__, resource_class.__name__, scope)
+
+    def bump(self, resource_class, scope='all'):
+        """
+        Invalidates the cached responses of ``resource_class`` in ``scope``,
+        which is ``'all'``, ``'list'`` or the primary key of a detail.
+        """
+        key = self._generation_key(resource_class, scope)
+
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            self.cache.set(key, int(time.time() * 1000), self.timeout)
+
+    def get_key(self, resource, request, pk=None):
+        resource_class = resource.__class__
+        scopes = ['all', pk is None and 'list' or str(pk)]
+        keys = [self._generation_key(resource_class, scope) for scope in scopes]
+        generations = self.cache.get_many(keys)
+
+        # Generations start at the current time, so responses cached before
+        # a generation was evicted from the cache are never used again.
+        for key in keys:
+            if not key in generations:
+                self.cache.add(key, int(time.time() * 1000), self.timeout)
+                generations[key] = self.cache.get(key)
+
+        parts = [
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+        ]
+        parts.extend(str(generations.get(key, 0)) for key in keys)
+
+        if self.vary_on_user:
+            parts.append(str(getattr(getattr(request, 'user', None), 'pk', None)))
+
+        return 'mangopie:response:%s.%s:%s' % (resource_class.__module__, resource_class.__name__, hashlib.md5('|'.join(parts)).hexdigest())
+
+    def get_response(self, resource, request, build_response, pk=None):
+        """
+        Returns the cached response for ``request`` or builds and caches it
+        with ``build_response``.
+        """
+        key = self.get_key(resource, request, pk)
+        cached = self.cache.get(key)
+        response = None
+
+        if cached is None:
+            response = build_response()
+
+            # Only cache complete, successful responses.
+            if response.status_code != 200 or getattr(response, 'streaming', False):
+                return response
+
+            content = response.content
+            cached = {
+                'content': content,
+                'content_type': response['Content-Type'],
+                'etag': '"%s"' % hashlib.md5(content).hexdigest(),
+                'last_modified': int(time.time()),
+            }
+
+            if len(content) <= self.max_size:
+                self.cache.set(key, cached, self.timeout)
+
+        if self.is_not_modified(request, cached):
+            response = http.HttpNotModified()
+        elif response is None:
+            response = HttpResponse(content=cached['content'], content_type=cached['content_type'])
+
+        self.add_headers(response, cached)
+        return response
+
+    def is_not_modified(self, request, cached):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        if if_none_match is not None:
+            return cached['etag'] in [etag.strip() for etag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and cached['last_modified'] <= if_modified_since
+
+    def add_headers(self, response, cached):
+        response['ETag'] = cached['etag']
+        response['Last-Modified'] = http_date(cached['last_modified'])
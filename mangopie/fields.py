@@ -21,7 +21,20 @@ class ListField(ApiField):
         self.inner_field = inner_field
 
     def convert(self, items):
-        return [self.inner_field.dehydrate(Bundle(obj=ListFieldValue(item))) for item in items]
+        if items is None:
+            return None
+
+        # Embedded documents are dehydrated all at once.
+        convert_many = getattr(self.inner_field, 'convert_many', None)
+
+        if convert_many is not None:
+            return convert_many(items)
+
+        # The inner field converts the items directly. Only empty items need
+        # the inner field's dehydrate to handle defaults and nulls.
+        convert = self.inner_field.convert
+        dehydrate = self.inner_field.dehydrate
+        return [dehydrate(Bundle(obj=ListFieldValue(item))) if item is None else convert(item) for item in items]
 
 
 class ReferenceList(RelatedField):
@@ -50,13 +63,13 @@ class ReferenceList(RelatedField):
             return None
 
         # if field data is not provided in the bundle and the object
-        # has data, we are most likely dealing with an update.
-        # In that case set the data on the bundle and proceed like
-        # it was provided. This is rather inefficient but keeps 
-        # complexity limited. 
+        # has data, we are most likely dealing with an update. The
+        # references stay as they are, so return None and let save_m2m
+        # skip the field. Use the raw data so the references are not
+        # dereferenced just to check for them.
         if bundle.data.get(self.instance_name) is None and \
-                getattr(bundle.obj, self.attribute) != []:
-            bundle.data[self.instance_name] = self.dehydrate(bundle)
+                bundle.obj._data.get(self.attribute):
+            return None
 
         if bundle.data.get(self.instance_name) is None:
             if self.blank:
@@ -89,7 +102,63 @@ class EmbeddedResourceField(ApiField):
     def __init__(self, resource_type, **kwargs):
         super(EmbeddedResourceField, self).__init__(**kwargs)
         self.resource_type = resource_type
+        self._embedded_resource = None
+
+    @property
+    def resource(self):
+        """
+        The resource instance used to dehydrate embedded documents. It is
+        created once and shared by all values of the field.
+        """
+        if self._embedded_resource is None:
+            self._embedded_resource = self.resource_type()
+
+        return self._embedded_resource
+
+    def convert(self, value):
+        if value is None:
+            return None
+
+        return self.resource.full_dehydrate(Bundle(obj=value))
+
+    def convert_many(self, values):
+        """
+        Dehydrates a list of embedded documents with the shared resource.
+        """
+        full_dehydrate = self.resource.full_dehydrate
+        return [None if value is None else full_dehydrate(Bundle(obj=value)) for value in values]
 
     def dehydrate(self, bundle):
-        doc = getattr(bundle.obj, self.attribute)
-        return self.resource_type().full_dehydrate(doc)
+        return self.convert(getattr(bundle.obj, self.attribute))
+
+
+class FileField(ApiField):
+    """
+    A file stored in GridFS. It is dehydrated to the file's metadata, the
+    content is served (and uploaded) by the resource's file endpoint.
+
+    The field is read only, files cannot be sent with the document.
+    """
+    dehydrated_type = 'file'
+    help_text = 'A file stored in GridFS.'
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('readonly', True)
+        super(FileField, self).__init__(**kwargs)
+
+    def convert(self, value):
+        if not value:
+            return None
+
+        grid_out = value.get()
+
+        if grid_out is None:
+            return None
+
+        return {
+            'filename': grid_out.filename,
+            'content_type': grid_out.content_type,
+            'length': grid_out.length,
+            'md5': getattr(grid_out, 'md5', None),
+            'upload_date': grid_out.upload_date,
+        }
@@ -0,0 +1,196 @@
+import json
+import logging
+import threading
+
+from pymongo import monitoring
+
+logger = logging.getLogger('mangopie.instrumentation')
+
+_local = threading.local()
+
+def current_stats():
+    """
+    Returns the ``QueryStats`` of the request handled by the current thread
+    or ``None``.
+    """
+    return getattr(_local, 'stats', None)
+
+class Phase(object):
+    """
+    Context manager that attributes the commands sent inside it to the phase
+    ``name`` (e.g. ``obj_get_list`` or ``save_m2m``). Does nothing if the
+    current request is not instrumented.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.stats = None
+
+    def __enter__(self):
+        self.stats = current_stats()
+
+        if self.stats is not None:
+            self.stats.phases.append(self.name)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.stats is not None:
+            self.stats.phases.pop()
+
+class StatsContext(object):
+    """
+    Context manager that collects the commands sent inside it in ``stats``,
+    which lets threads working for a request add to its statistics.
+    """
+    def __init__(self, stats):
+        self.stats = stats
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = current_stats()
+        _local.stats = self.stats
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _local.stats = self.previous
+
+class QueryStats(object):
+    """
+    The number of commands, the time spent in MongoDB and the number of
+    documents returned for one request, in total and per phase.
+    """
+    def __init__(self):
+        self.phases = ['other']
+        self.totals = {}
+        self.single_lookups = {}
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def get_totals(self, phase=None):
+        if phase is not None:
+            return self.totals.get(phase, {'queries': 0, 'time': 0.0, 'documents': 0})
+
+        totals = {'queries': 0, 'time': 0.0, 'documents': 0}
+
+        for phase_totals in self.totals.values():
+            for key in totals:
+                totals[key] += phase_totals[key]
+
+        return totals
+
+    def started(self, event):
+        with self._lock:
+            self._started_command(event)
+
+    def _started_command(self, event):
+        self._started[event.request_id] = self.phases[-1]
+
+        # Count lookups of a single document by id to detect N+1 queries.
+        if event.command_name == 'find':
+            query = event.command.get('filter') or {}
+
+            if query.keys() == ['_id'] and not isinstance(query['_id'], dict):
+                collection = event.command['find']
+                self.single_lookups[collection] = self.single_lookups.get(collection, 0) + 1
+
+    def finished(self, event, reply=None):
+        with self._lock:
+            self._finished_command(event, reply)
+
+    def _finished_command(self, event, reply):
+        phase = self._started.pop(event.request_id, self.phases[-1])
+        totals = self.totals.setdefault(phase, {'queries': 0, 'time': 0.0, 'documents': 0})
+        totals['queries'] += 1
+        totals['time'] += event.duration_micros / 1000.0
+
+        if reply is not None:
+            cursor = reply.get('cursor') or {}
+            totals['documents'] += len(cursor.get('firstBatch', cursor.get('nextBatch', [])))
+
+    def n_plus_one(self, threshold):
+        """
+        Returns the collections that were queried for single documents at
+        least ``threshold`` times.
+        """
+        return sorted(
+            collection for collection, count in self.single_lookups.items()
+            if count >= threshold
+        )
+
+class CommandLogger(monitoring.CommandListener):
+    """
+    Passes pymongo's command events to the statistics of the request handled
+    by the current thread.
+
+    It has to be registered before the connection is created, either
+    globally with ``pymongo.monitoring.register(CommandLogger())`` or for a
+    single connection with ``connect('db', event_listeners=[CommandLogger()])``.
+    """
+    def started(self, event):
+        stats = current_stats()
+
+        if stats is not None:
+            stats.started(event)
+
+    def succeeded(self, event):
+        stats = current_stats()
+
+        if stats is not None:
+            stats.finished(event, event.reply)
+
+    def failed(self, event):
+        stats = current_stats()
+
+        if stats is not None:
+            stats.finished(event)
+
+class QueryInstrumentation(object):
+    """
+    Collects ``QueryStats`` for the requests of a ``DocumentResource``.
+
+    The totals are added to the response as ``X-Mongo-Queries``,
+    ``X-Mongo-Time`` (in ms) and ``X-Mongo-Documents`` headers, with
+    ``phase_header`` the totals per phase are sent as JSON in
+    ``X-Mongo-Phases``. ``callback`` is called with the resource, the request
+    and the ``QueryStats`` of every request, e.g. to send metrics. A warning
+    is logged if a collection is queried for single documents at least
+    ``n_plus_one_threshold`` times.
+    """
+    def __init__(self, headers=True, phase_header=False, callback=None, n_plus_one_threshold=10):
+        self.headers = headers
+        self.phase_header = phase_header
+        self.callback = callback
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    def dispatch(self, resource, request, dispatch):
+        """
+        Runs ``dispatch`` while collecting the statistics of the request.
+        """
+        previous = current_stats()
+        stats = _local.stats = QueryStats()
+
+        try:
+            response = dispatch()
+        finally:
+            _local.stats = previous
+
+        self.report(resource, request, response, stats)
+        return response
+
+    def report(self, resource, request, response, stats):
+        totals = stats.get_totals()
+
+        if self.headers:
+            response['X-Mongo-Queries'] = str(totals['queries'])
+            response['X-Mongo-Time'] = '%.3f' % totals['time']
+            response['X-Mongo-Documents'] = str(totals['documents'])
+
+        if self.phase_header:
+            response['X-Mongo-Phases'] = json.dumps(stats.totals, sort_keys=True)
+
+        if self.n_plus_one_threshold:
+            for collection in stats.n_plus_one(self.n_plus_one_threshold):
+                logger.warning(
+                    "%s %s queried '%s' for single documents %s times. Consider batch_dereference.",
+                    request.method, request.path, collection, stats.single_lookups[collection]
+                )
+
+        if self.callback is not None:
+            self.callback(resource, request, stats)
@@ -0,0 +1,290 @@
+import base64
+import hashlib
+import json
+import urllib
+
+from bson import json_util
+
+from django.core.cache import cache
+
+from tastypie.exceptions import BadRequest
+from tastypie.paginator import Paginator as BasePaginator
+
+COUNT_STRATEGIES = ('exact', 'none', 'estimated', 'cached')
+
+class Paginator(BasePaginator):
+    """
+    Tastypie's paginator with different ways to get the ``total_count``.
+
+    ``count_strategy`` is one of:
+
+      * ``'exact'`` counts the objects, like tastypie does.
+      * ``'none'`` does not count, ``total_count`` is ``None``.
+      * ``'estimated'`` uses the collection's ``estimated_document_count()``
+        for unfiltered queries and counts filtered ones.
+      * ``'cached'`` caches counts keyed by the query for
+        ``count_cache_timeout`` seconds.
+
+    The strategy that was used is added to the ``meta`` as
+    ``count_strategy``.
+    """
+    def __init__(self, request_data, objects, resource_uri=None, limit=None, offset=0, count_strategy='exact', count_cache_timeout=60):
+        super(Paginator, self).__init__(request_data, objects, resource_uri=resource_uri, limit=limit, offset=offset)
+
+        if not count_strategy in COUNT_STRATEGIES:
+            raise ValueError("Unknown count strategy '%s'." % count_strategy)
+
+        self.count_strategy = count_strategy
+        self.count_cache_timeout = count_cache_timeout
+        self.used_count_strategy = None
+
+    def get_count_cache_key(self):
+        document_type = self.objects._document
+        query = json_util.dumps(self.objects._query, sort_keys=True)
+        return 'mangopie:count:%s:%s' % (document_type._get_collection_name(), hashlib.md5(query).hexdigest())
+
+    def get_count(self):
+        """
+        Returns the total number of objects according to ``count_strategy``
+        or ``None`` if they are not counted.
+        """
+        self.used_count_strategy = self.count_strategy
+
+        if self.count_strategy == 'none':
+            return None
+
+        if self.count_strategy == 'estimated':
+            if not self.objects._query:
+                return self.objects._document._get_collection().estimated_document_count()
+
+            self.used_count_strategy = 'exact'
+
+        if self.count_strategy == 'cached':
+            key = self.get_count_cache_key()
+            count = cache.get(key)
+
+            if count is None:
+                count = self.objects.count()
+                cache.set(key, count, self.count_cache_timeout)
+
+            return count
+
+        return super(Paginator, self).get_count()
+
+    def page(self):
+        """
+        Generates all pertinent data about the requested page.
+
+        Without a count one more object than requested is read to tell if
+        there is a next page.
+        """
+        limit = self.get_limit()
+        offset = self.get_offset()
+        count = self.get_count()
+
+        if count is None and limit:
+            objects = list(self.get_slice(limit + 1, offset))
+            has_next = len(objects) > limit
+            objects = objects[:limit]
+        else:
+            objects = self.get_slice(limit, offset)
+
+        meta = {
+            'offset': offset,
+            'limit': limit,
+            'total_count': count,
+            'count_strategy': self.used_count_strategy,
+        }
+
+        if limit:
+            meta['previous'] = self.get_previous(limit, offset)
+
+            if count is None:
+                meta['next'] = has_next and self._generate_uri(limit, offset + limit) or None
+            else:
+                meta['next'] = self.get_next(limit, offset, count)
+
+        return {
+            'objects': objects,
+            'meta': meta,
+        }
+
+class CursorPaginator(Paginator):
+    """
+    Pages through a queryset with range queries instead of ``skip()``.
+
+    The position in the collection is passed around in an opaque ``cursor``
+    token which encodes the sort key and ``_id`` of the last object of the
+    previous page. The queryset's ordering (at most one field) is kept and
+    ``_id`` is used as tie breaker, so a compound index on both fields makes
+    every page as cheap as the first one.
+
+    Only forward paging is supported, ``previous`` is always ``None``. No
+    ``total_count`` is calculated unless another ``count_strategy`` than
+    ``'none'`` is used.
+    """
+    cursor_param = 'cursor'
+
+    def __init__(self, request_data, objects, resource_uri=None, limit=None, offset=0, count_strategy='none', count_cache_timeout=60):
+        super(CursorPaginator, self).__init__(request_data, objects, resource_uri=resource_uri, limit=limit, offset=offset, count_strategy=count_strategy, count_cache_timeout=count_cache_timeout)
+
+    def get_ordering(self):
+        """
+        Returns the name of the field the objects are sorted by and the sort
+        direction (``1`` or ``-1``). The name is ``None`` when sorting by
+        ``_id`` only.
+        """
+        ordering = [(key, direction) for key, direction in (getattr(self.objects, '_ordering', None) or []) if key != '_id']
+
+        if len(ordering) > 1:
+            raise BadRequest("The cursor paginator can only sort by a single field.")
+
+        if not ordering:
+            return None, 1
+
+        key, direction = ordering[0]
+
+        # Sorting by ``$text_score`` gives a ``$meta`` expression.
+        if isinstance(direction, dict):
+            raise BadRequest("The cursor paginator cannot sort by relevance.")
+
+        document_type = self.objects._document
+        return document_type._reverse_db_field_map.get(key, key), direction
+
+    def encode_cursor(self, obj, field_name):
+        if isinstance(obj, dict):
+            # Raw data from a queryset using ``as_pymongo()``.
+            values = [obj.get('_id')]
+
+            if field_name is not None:
+                values.insert(0, obj.get(self.objects._document._fields[field_name].db_field))
+        else:
+            values = [obj.pk]
+
+            if field_name is not None:
+                field = self.objects._document._fields[field_name]
+                value = getattr(obj, field_name)
+                values.insert(0, field.to_mongo(value) if value is not None else None)
+
+        return base64.urlsafe_b64encode(json.dumps(values, default=json_util.default))
+
+    def decode_cursor(self, cursor, field_name):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(cursor)), object_hook=json_util.object_hook)
+        except (TypeError, ValueError):
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+        if not isinstance(values, list) or len(values) != (field_name is None and 1 or 2):
+            raise BadRequest("Invalid cursor '%s' provided." % cursor)
+
+        return values
+
+    def get_cursor_query(self, db_field, direction, value, pk):
+        """
+        Returns the query for the objects following the object whose sort
+        key is ``value`` and whose ``_id`` is ``pk``.
+
+        Objects without a sort key (``null`` or missing) sort before all
+        others, but never match a range query, so they are matched
+        explicitly.
+        """
+        operator = '$gt' if direction == 1 else '$lt'
+        query = [{db_field: value, '_id': {operator: pk}}]
+
+        if value is not None:
+            query.insert(0, {db_field: {operator: value}})
+
+            if direction != 1:
+                query.append({db_field: None})
+        elif direction == 1:
+            query.append({db_field: {'$exists': True, '$ne': None}})
+
+        return {'$or': query}
+
+    def get_slice(self, limit, cursor):
+        """
+        Returns the objects following ``cursor`` plus one extra object, which
+        tells if there is another page.
+        """
+        field_name, direction = self.get_ordering()
+        prefix = '' if direction == 1 else '-'
+        operator = '$gt' if direction == 1 else '$lt'
+
+        if field_name is None:
+            objects = self.objects.order_by('%sid' % prefix)
+        else:
+            objects = self.objects.order_by('%s%s' % (prefix, field_name), '%sid' % prefix)
+
+            # The sort key is needed for the next cursor, so make sure it
+            # is loaded if the resource projected the queryset.
+            if objects._loaded_fields:
+                objects = objects.only(field_name)
+
+        if cursor:
+            values = self.decode_cursor(cursor, field_name)
+
+            if field_name is None:
+                query = {'_id': {operator: values[0]}}
+            else:
+                db_field = self.objects._document._fields[field_name].db_field
+                query = self.get_cursor_query(db_field, direction, values[0], values[1])
+
+            objects = objects.filter(__raw__=query)
+
+        if limit:
+            objects = objects[:limit + 1]
+
+        return list(objects), field_name
+
+    def get_next(self, limit, cursor):
+        if self.resource_uri is None:
+            return None
+
+        try:
+            # QueryDict has a urlencode method that can handle multiple values for the same key
+            request_params = self.request_data.copy()
+
+            for name in ('limit', 'offset', self.cursor_param):
+                if name in request_params:
+                    del(request_params[name])
+
+            request_params.update({'limit': limit, self.cursor_param: cursor})
+            encoded_params = request_params.urlencode()
+        except AttributeError:
+            request_params = {}
+
+            for key, value in self.request_data.items():
+                if isinstance(value, unicode):
+                    request_params[key] = value.encode('utf-8')
+                else:
+                    request_params[key] = value
+
+            request_params.pop('offset', None)
+            request_params.update({'limit': limit, self.cursor_param: cursor})
+            encoded_params = urllib.urlencode(request_params)
+
+        return '%s?%s' % (self.resource_uri, encoded_params)
+
+    def page(self):
+        """
+        Generates all pertinent data about the requested page.
+        """
+        limit = self.get_limit()
+        count = self.get_count()
+        objects, field_name = self.get_slice(limit, self.request_data.get(self.cursor_param))
+        next_uri = None
+
+        if limit and len(objects) > limit:
+            objects = objects[:limit]
+            next_uri = self.get_next(limit, self.encode_cursor(objects[-1], field_name))
+
+        return {
+            'objects': objects,
+            'meta': {
+                'limit': limit,
+                'next': next_uri,
+                'previous': None,
+                'total_count': count,
+                'count_strategy': self.used_count_strategy,
+            },
+        }
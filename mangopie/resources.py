@@ -1,14 +1,58 @@
+import calendar
+import decimal
+import itertools
+import json
+import logging
+import re
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+from django.core.cache import cache as django_cache
+from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.core.urlresolvers import resolve, Resolver404
+from django.http import HttpResponse
+from django.utils.http import http_date
+
+try:
+    from django.conf.urls import url
+except ImportError:
+    # Django < 1.4
+    from django.conf.urls.defaults import url
+
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # Django < 1.5 streams responses that are built from an iterator.
+    StreamingHttpResponse = HttpResponse
+
 from tastypie import fields as tasty_fields
+from tastypie import http
 from tastypie.bundle import Bundle
-from tastypie.exceptions import TastypieError, NotFound
+from tastypie.constants import ALL, ALL_WITH_RELATIONS
+from tastypie.exceptions import TastypieError, NotFound, BadRequest, ImmediateHttpResponse, InvalidFilterError
+from tastypie.paginator import Paginator as BasePaginator
 from tastypie.resources import Resource, DeclarativeMetaclass
-from tastypie.utils import dict_strip_unicode_keys
+from tastypie.utils import dict_strip_unicode_keys, trailing_slash
 
-from mongoengine import EmbeddedDocument
+from mongoengine import Document, EmbeddedDocument, ValidationError
 from mongoengine import fields as mongo_fields
-from mongoengine.queryset import DoesNotExist
+from mongoengine.connection import get_db
+from mongoengine.queryset import DoesNotExist, MultipleObjectsReturned as MultipleDocumentsReturned
+
+from bson import DBRef, ObjectId, SON, json_util
+from bson.errors import InvalidId
+from dateutil import parser as date_parser
+from pymongo import InsertOne, ReplaceOne, read_preferences
+from pymongo.errors import BulkWriteError
+from gridfs import GridOut
 
-from mangopie import fields
+from mangopie import cache, fields
+from mangopie.instrumentation import Phase, StatsContext, current_stats
+from mangopie.paginator import Paginator
+
+logger = logging.getLogger('mangopie.resources')
 
 FIELD_MAP = {
     mongo_fields.BooleanField: tasty_fields.BooleanField,
@@ -16,14 +60,218 @@ FIELD_MAP = {
     mongo_fields.IntField: tasty_fields.IntegerField,
     mongo_fields.FloatField: tasty_fields.FloatField,
     mongo_fields.ListField: fields.ListField,
+    mongo_fields.FileField: fields.FileField,
 # Char Fields:
 #  StringField, ObjectIdField, EmailField, URLField
 # TODO
 # 'ReferenceField',
-# 'DecimalField', 'GenericReferenceField', 'FileField',
+# 'DecimalField', 'GenericReferenceField',
 # 'BinaryField', , 'GeoPointField']
 }
 
+LOOKUP_SEP = '__'
+
+# The query terms filters can end with. ``not`` can precede any of them.
+QUERY_TERMS = ['ne', 'gt', 'gte', 'lt', 'lte', 'in', 'nin', 'mod', 'all', 'size', 'exists',
+    'within_distance', 'within_spherical_distance', 'within_box', 'within_polygon', 'near',
+    'near_sphere', 'contains', 'icontains', 'startswith', 'istartswith', 'endswith', 'iendswith',
+    'exact', 'iexact', 'match']
+
+# Terms whose (comma separated) values are lists of the field's type.
+LIST_QUERY_TERMS = ('in', 'nin', 'all')
+
+# Terms whose values are passed on as they are.
+RAW_QUERY_TERMS = ('contains', 'icontains', 'startswith', 'istartswith', 'endswith', 'iendswith',
+    'iexact', 'match', 'within_distance', 'within_spherical_distance', 'within_box', 'within_polygon',
+    'near', 'near_sphere')
+
+# Accumulators supported by the aggregation endpoint.
+AGGREGATE_OPERATORS = ('sum', 'avg', 'min', 'max')
+
+# Maps the list operators accepted in PATCH payloads to mongoengine's
+# update operators.
+LIST_OPERATORS = {
+    '$push': 'push_all',
+    '$addToSet': 'add_to_set',
+    '$pull': 'pull_all',
+}
+
+# Resource classes created for embedded documents, keyed by document type.
+_embedded_resources = {}
+
+# Maps the names of MongoDB's read preference modes to pymongo's classes.
+READ_PREFERENCES = {
+    'primary': read_preferences.Primary,
+    'primaryPreferred': read_preferences.PrimaryPreferred,
+    'secondary': read_preferences.Secondary,
+    'secondaryPreferred': read_preferences.SecondaryPreferred,
+    'nearest': read_preferences.Nearest,
+}
+
+# Request methods that write and make a client read from the primary
+# afterwards.
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# The thread pool shared by all resources dehydrating related fields
+# concurrently, created when it is first needed.
+_dehydration_pool = None
+_dehydration_pool_lock = threading.Lock()
+_dehydration_local = threading.local()
+
+# Related documents loaded in advance by ``prefetch_related`` for the bulk
+# write running in the current thread.
+_prefetch_local = threading.local()
+
+# Matches a single byte range of a ``Range`` header.
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def _list_operator(value):
+    """
+    Returns if ``value`` is a list operator like ``{"$push": [...]}``.
+    """
+    return isinstance(value, dict) and len(value) == 1 and value.keys()[0] in LIST_OPERATORS
+
+def _reference_id(value):
+    """
+    Returns the id of a not yet dereferenced reference or ``None`` if
+    ``value`` already is a document.
+    """
+    if isinstance(value, Document):
+        return None
+    if isinstance(value, DBRef):
+        return value.id
+    return value
+
+def _function(method):
+    """
+    Returns the plain function of a (unbound) method.
+    """
+    return getattr(method, '__func__', method)
+
+def _get_dehydration_pool():
+    """
+    Returns the shared thread pool for concurrent dehydration. Its size is
+    ``MANGOPIE_DEHYDRATION_THREADS`` (10 by default) from the settings.
+    """
+    global _dehydration_pool
+
+    if _dehydration_pool is None:
+        with _dehydration_pool_lock:
+            if _dehydration_pool is None:
+                _dehydration_pool = ThreadPool(getattr(settings, 'MANGOPIE_DEHYDRATION_THREADS', 10))
+
+    return _dehydration_pool
+
+def _dehydrate_in_pool(stats, field_object, bundle):
+    """
+    Dehydrates ``field_object`` in a thread of the pool. Its queries are
+    added to the request's ``stats``.
+    """
+    _dehydration_local.in_pool = True
+
+    try:
+        with StatsContext(stats):
+            return field_object.dehydrate(bundle)
+    finally:
+        _dehydration_local.in_pool = False
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+
+    value = value.lower()
+
+    if value in ('true', '1', 'yes', 'on'):
+        return True
+
+    if value in ('false', '0', 'no', 'off'):
+        return False
+
+    raise ValueError("Invalid boolean '%s'." % value)
+
+def _to_datetime(value):
+    return date_parser.parse(value)
+
+def _to_object_id(value):
+    """
+    Converts an id or the URI of a resource (e.g. ``/api/v1/author/<id>/``)
+    to an ``ObjectId``.
+    """
+    if isinstance(value, ObjectId):
+        return value
+
+    return ObjectId(value.rstrip('/').rsplit('/', 1)[-1])
+
+# Converts filter values for document fields of these types (checked in
+# order).
+FILTER_COERCIONS = (
+    (mongo_fields.BooleanField, _to_bool),
+    (mongo_fields.IntField, int),
+    (mongo_fields.LongField, long),
+    (mongo_fields.FloatField, float),
+    (mongo_fields.DecimalField, decimal.Decimal),
+    (mongo_fields.DateTimeField, _to_datetime),
+    (mongo_fields.ObjectIdField, _to_object_id),
+    (mongo_fields.ReferenceField, _to_object_id),
+)
+
+def _text_score(obj):
+    """
+    Returns the relevance of a document found by a text search.
+    """
+    if isinstance(obj, RawDocument):
+        return obj._son.get('_text_score')
+
+    return obj.get_text_score()
+
+class RawDocument(object):
+    """
+    A read only stand-in for a document, built from the raw data returned by
+    ``as_pymongo()``.
+
+    Field values are converted with the ``to_python`` method of their
+    mongoengine field and get the field's default like mongoengine sets it:
+    ``null`` values always, missing values only if the query was not
+    projected (``projected`` is ``False``). So dehydrating a ``RawDocument``
+    gives the same result as dehydrating the document. Any other attribute
+    (e.g. a method like ``get_absolute_url``) is looked up on a real
+    document, which is only created when it is needed.
+    """
+    def __init__(self, document_type, son, field_map, projected=False):
+        self._document_type = document_type
+        self._son = son
+        self._document = None
+        self._data = {}
+
+        for name, (db_field, field) in field_map.items():
+            value = son.get(db_field)
+
+            if value is not None:
+                value = field.to_python(value)
+            elif not field.null and field.default is not None and (db_field in son or not projected):
+                value = field.default
+
+                if callable(value):
+                    value = value()
+
+            self._data[name] = value
+
+    @property
+    def pk(self):
+        return self._son.get('_id')
+
+    def __getattr__(self, name):
+        if name.startswith('__') or name in ('_data', '_son', '_document', '_document_type'):
+            raise AttributeError(name)
+
+        if name in self._data:
+            return self._data[name]
+
+        if self._document is None:
+            self._document = self._document_type._from_son(self._son)
+
+        return getattr(self._document, name)
+
 class DocumentDeclarativeMetaclass(DeclarativeMetaclass):
     def __new__(cls, name, bases, attrs):
         meta = attrs.get('Meta')
@@ -46,7 +294,12 @@ class DocumentDeclarativeMetaclass(DeclarativeMetaclass):
                     setattr(meta, 'include_resource_uri', False)
 
         new_class = super(DocumentDeclarativeMetaclass, cls).__new__(cls, name, bases, attrs)
-        fields = getattr(new_class._meta, 'fields', [])
+
+        # Use mangopie's paginator unless another one was set.
+        if new_class._meta.paginator_class is BasePaginator:
+            new_class._meta.paginator_class = Paginator
+
+        include_fields = getattr(new_class._meta, 'fields', [])
         excludes = getattr(new_class._meta, 'excludes', [])
         field_names = new_class.base_fields.keys()
 
@@ -55,13 +308,13 @@ class DocumentDeclarativeMetaclass(DeclarativeMetaclass):
                 continue
             if field_name in new_class.declared_fields:
                 continue
-            if len(fields) and not field_name in fields:
+            if len(include_fields) and not field_name in include_fields:
                 del(new_class.base_fields[field_name])
             if len(excludes) and field_name in excludes:
                 del(new_class.base_fields[field_name])
 
         # Add in the new fields.
-        new_class.base_fields.update(new_class.get_fields(fields, excludes))
+        new_class.base_fields.update(new_class.get_fields(include_fields, excludes))
 
         if getattr(new_class._meta, 'include_absolute_url', True):
             if not 'absolute_url' in new_class.base_fields:
@@ -69,6 +322,29 @@ class DocumentDeclarativeMetaclass(DeclarativeMetaclass):
         elif 'absolute_url' in new_class.base_fields and not 'absolute_url' in attrs:
             del(new_class.base_fields['absolute_url'])
 
+        new_class._meta.projection_map = new_class.get_projection_map()
+        new_class._meta.raw_field_map = new_class.get_raw_field_map()
+        new_class._meta.dehydration_plan = new_class.get_dehydration_plan()
+        new_class._meta.read_preferences = new_class.get_read_preferences()
+
+        # Register right away, so processes that only write invalidate the
+        # cached responses too.
+        response_cache = getattr(new_class._meta, 'response_cache', None)
+
+        if response_cache is not None:
+            response_cache.register(new_class)
+
+        new_class.check_search_fields()
+        new_class._meta.filter_specs = new_class.get_filter_specs()
+        new_class._meta.related_field_count = len([
+            field_object for field_object in new_class.base_fields.values()
+            if getattr(field_object, 'dehydrated_type', None) == 'related'
+        ])
+        new_class._meta.file_fields = [
+            field_name for field_name, field_object in new_class.base_fields.items()
+            if isinstance(field_object, fields.FileField)
+        ]
+
         return new_class
 
 class DocumentResource(Resource):
@@ -85,10 +361,22 @@ class DocumentResource(Resource):
 
     @classmethod
     def resource_for_document_type(cls, document_type):
+        """
+        Returns the resource class for embedded documents of
+        ``document_type``. The class is created once per document type and
+        shared by all resources embedding it.
+        """
+        try:
+            return _embedded_resources[document_type]
+        except KeyError:
+            pass
+
         class Meta:
             object_class = document_type
 
-        return DocumentDeclarativeMetaclass('%sResource' % document_type.__name__, (DocumentResource,), {'Meta': Meta})
+        resource_type = DocumentDeclarativeMetaclass('%sResource' % document_type.__name__, (DocumentResource,), {'Meta': Meta})
+        _embedded_resources[document_type] = resource_type
+        return resource_type
 
     @classmethod
     def api_field_from_mongoengine_field(cls, f, default=tasty_fields.CharField):
@@ -169,6 +457,241 @@ class DocumentResource(Resource):
 
         return final_fields
 
+    @classmethod
+    def get_projection_map(cls):
+        """
+        Maps the name of every resource field to the document field it reads.
+
+        Fields that are not backed by a document field (e.g. ``absolute_url``)
+        are left out. Returns ``None`` if the resource has no document or if
+        projections are disabled with ``projection = False`` on ``Meta``.
+        """
+        document_type = getattr(cls._meta, 'object_class', None)
+
+        if document_type is None or getattr(cls._meta, 'projection', True) is False:
+            return None
+
+        projection_map = {}
+
+        for field_name, field_object in cls.base_fields.items():
+            if not isinstance(field_object.attribute, basestring):
+                continue
+
+            attribute = field_object.attribute.split('__')[0]
+
+            if attribute in document_type._fields:
+                projection_map[field_name] = attribute
+
+        return projection_map
+
+    @classmethod
+    def get_dehydration_plan(cls):
+        """
+        Compiles the steps ``full_dehydrate`` runs for every object.
+
+        Returns a list of ``(field_name, attribute, method_name)`` tuples.
+        ``attribute`` is set for fields that use the default
+        ``ApiField.dehydrate`` on a plain attribute, whose values can be
+        passed straight to the field's ``convert``. ``method_name`` is the name
+        of an optional ``dehydrate_<field_name>`` method.
+        """
+        plan = []
+
+        for field_name, field_object in cls.base_fields.items():
+            attribute = None
+
+            if _function(type(field_object).dehydrate) is _function(tasty_fields.ApiField.dehydrate) and \
+                    isinstance(field_object.attribute, basestring) and not '__' in field_object.attribute:
+                attribute = field_object.attribute
+
+            method_name = "dehydrate_%s" % field_name
+
+            if not callable(getattr(cls, method_name, None)):
+                method_name = None
+
+            plan.append((field_name, attribute, method_name))
+
+        return plan
+
+    @classmethod
+    def get_read_preferences(cls):
+        """
+        Compiles ``read_preference`` and ``max_staleness`` (in seconds) on
+        ``Meta`` to pymongo read preferences keyed by request method.
+
+        ``read_preference`` is the name of a read preference mode used for
+        ``GET`` requests or a dict of modes keyed by request method.
+        """
+        read_preference = getattr(cls._meta, 'read_preference', None)
+
+        if read_preference is None:
+            return {}
+
+        if isinstance(read_preference, basestring):
+            read_preference = {'GET': read_preference}
+
+        max_staleness = getattr(cls._meta, 'max_staleness', None)
+        compiled = {}
+
+        for method, mode in read_preference.items():
+            if not mode in READ_PREFERENCES:
+                raise TastypieError("Unknown read preference '%s' for %s requests." % (mode, method))
+
+            if mode == 'primary' or max_staleness is None:
+                compiled[method.upper()] = READ_PREFERENCES[mode]()
+            else:
+                compiled[method.upper()] = READ_PREFERENCES[mode](max_staleness=max_staleness)
+
+        return compiled
+
+    @classmethod
+    def get_filter_coercion(cls, document_field):
+        """
+        Returns the function converting filter values for ``document_field``
+        or ``None`` if they are used as they are.
+        """
+        if isinstance(document_field, mongo_fields.ReferenceField):
+            # Use the type of the referenced document's primary key.
+            try:
+                document_type = document_field.document_type
+                id_field = document_type._fields[document_type._meta['id_field']]
+            except Exception:
+                return _to_object_id
+
+            if not isinstance(id_field, mongo_fields.ObjectIdField):
+                return cls.get_filter_coercion(id_field)
+
+        for field_type, coercion in FILTER_COERCIONS:
+            if isinstance(document_field, field_type):
+                return coercion
+
+        return None
+
+    @classmethod
+    def get_filter_specs(cls):
+        """
+        Compiles the filters of the resource from the document's fields and
+        ``filtering`` on ``Meta``.
+
+        Returns a dict keyed by resource field name of dicts with the
+        ``lookup`` for mongoengine, the ``coerce`` function for values (of
+        the elements for list fields), if the field is a ``list`` and the
+        allowed ``terms`` (``None`` for all of them). Without ``filtering``
+        all fields allow all terms.
+        """
+        document_type = getattr(cls._meta, 'object_class', None)
+        filtering = getattr(cls._meta, 'filtering', None) or {}
+        filter_specs = {}
+
+        if document_type is None:
+            return filter_specs
+
+        for field_name, field_object in cls.base_fields.items():
+            attribute = field_object.attribute
+
+            # Only fields backed by a document field can be filtered.
+            if not isinstance(attribute, basestring) or not attribute.split(LOOKUP_SEP)[0] in document_type._fields:
+                continue
+
+            document_field = document_type._fields.get(attribute)
+            is_list = isinstance(document_field, mongo_fields.ListField)
+
+            if is_list:
+                document_field = document_field.field
+
+            if not filtering:
+                terms = None
+            elif filtering.get(field_name) in (ALL, ALL_WITH_RELATIONS):
+                terms = None
+            else:
+                terms = set(filtering.get(field_name) or [])
+
+            filter_specs[field_name] = {
+                'lookup': attribute,
+                'coerce': cls.get_filter_coercion(document_field) if document_field is not None else None,
+                'list': is_list,
+                'terms': terms,
+            }
+
+        return filter_specs
+
+    @classmethod
+    def get_raw_field_map(cls):
+        """
+        Maps every document field to its ``db_field`` and the mongoengine
+        field, which converts the raw value. Used to build ``RawDocument``
+        instances when ``raw_reads`` is enabled.
+        """
+        document_type = getattr(cls._meta, 'object_class', None)
+
+        if document_type is None:
+            return {}
+
+        return dict(
+            (name, (f.db_field, f))
+            for name, f in document_type._fields.items()
+        )
+
+    def get_requested_fields(self, request):
+        """
+        Returns the resource fields requested with ``?fields=a,b`` or ``None``
+        if all fields should be dehydrated.
+        """
+        if request is None or getattr(request, 'method', None) != 'GET':
+            return None
+
+        requested = request.GET.get('fields')
+
+        if not requested:
+            return None
+
+        return set(name for name in requested.split(',') if name in self.fields)
+
+    def apply_projection(self, request, object_list):
+        """
+        Limits ``object_list`` to the document fields needed by the resource.
+
+        Additional document fields that must always be loaded (e.g. because a
+        method used by a field reads them) can be listed in ``projection`` on
+        ``Meta``.
+        """
+        projection_map = self._meta.projection_map
+
+        if projection_map is None:
+            return object_list
+
+        requested = self.get_requested_fields(request)
+        only_fields = set()
+
+        for field_name, attribute in projection_map.items():
+            if requested is None or field_name in requested:
+                only_fields.add(attribute)
+
+        extra_fields = getattr(self._meta, 'projection', True)
+
+        if isinstance(extra_fields, (list, tuple)):
+            only_fields.update(extra_fields)
+
+        if not only_fields:
+            # mongoengine loads all fields when only() gets no arguments.
+            only_fields.add('pk')
+
+        if getattr(self._meta, 'raw_reads', False):
+            # ``as_pymongo()`` drops the keys of embedded documents that are
+            # not listed in ``only()``, so they are read unprojected.
+            document_fields = self._meta.object_class._fields
+
+            for name in only_fields:
+                field = document_fields.get(name)
+
+                if isinstance(field, mongo_fields.ListField):
+                    field = field.field
+
+                if isinstance(field, mongo_fields.EmbeddedDocumentField):
+                    return object_list
+
+        return object_list.only(*only_fields)
+
     def _new_query(self):
         return self._meta.queryset.clone()
 
@@ -177,27 +700,76 @@ class DocumentResource(Resource):
         An ORM-specific implementation of ``get_object_list``.
 
         Returns a queryset that may have been limited by authorization or other
-        overrides.
+        overrides. Reads only load the document fields the resource exposes.
         """
         base_object_list = self._new_query()
+        read_preference = self.get_read_preference(request)
+
+        if read_preference is not None:
+            base_object_list = base_object_list.read_preference(read_preference)
+
+        if getattr(request, 'method', None) == 'GET':
+            base_object_list = self.apply_projection(request, base_object_list)
 
         # Limit it as needed.
         authed_object_list = self.apply_authorization_limits(request, base_object_list)
 
         return authed_object_list
 
+    def get_client_key(self, request):
+        """
+        Returns the cache key that marks a client, identified by its user or
+        its address, as having written recently.
+        """
+        user = getattr(request, 'user', None)
+
+        if user is not None and user.is_authenticated():
+            return 'mangopie:primary:user:%s' % user.pk
+
+        return 'mangopie:primary:addr:%s' % request.META.get('REMOTE_ADDR')
+
+    def reads_from_primary(self, request):
+        """
+        Returns if the client of ``request`` wrote less than
+        ``read_your_writes`` seconds ago and should see its own writes.
+        """
+        if not getattr(self._meta, 'read_your_writes', 0) or request is None:
+            return False
+
+        recently_written = getattr(request, '_mangopie_primary', None)
+
+        if recently_written is None:
+            recently_written = request._mangopie_primary = bool(django_cache.get(self.get_client_key(request)))
+
+        return recently_written
+
+    def get_read_preference(self, request):
+        """
+        Returns the read preference for the method of ``request`` or ``None``
+        to read from the primary.
+        """
+        read_preference = self._meta.read_preferences.get(getattr(request, 'method', None))
+
+        if read_preference is None or self.reads_from_primary(request):
+            return None
+
+        return read_preference
+
     def build_filters(self, filters=None):
         """ Given a dictionary of filters, create the necessary ORM-level filters.
 
             Keys should be resource fields, **NOT** model fields.
 
-            Valid values are either a list of Django filter types (i.e.
+            Valid values are either a list of query terms (i.e.
             ``['startswith', 'exact', 'lte']``), the ``ALL`` constant or the
-            ``ALL_WITH_RELATIONS`` constant. """
+            ``ALL_WITH_RELATIONS`` constant.
+
+            Values are converted to the type of the document field, invalid
+            filters and values raise ``BadRequest``. """
         # At the declarative level:
         #     filtering = {
         #         'resource_field_name': ['exact', 'startswith', 'endswith', 'contains'],
-        #         'resource_field_name_2': ['exact', 'gt', 'gte', 'lt', 'lte', 'range'],
+        #         'resource_field_name_2': ['exact', 'gt', 'gte', 'lt', 'lte', 'in'],
         #         'resource_field_name_3': ALL,
         #         'resource_field_name_4': ALL_WITH_RELATIONS,
         #         ...
@@ -207,130 +779,1221 @@ class DocumentResource(Resource):
             filters = {}
 
         qs_filters = {}
-
-        LOOKUP_SEP = '__'
-        QUERY_TERMS = ['ne', 'gt', 'gte', 'lt', 'lte', 'in', 'nin', 'mod', 'all', 'size', 'exists', 'not',
-            'within_distance', 'within_spherical_distance', 'within_box', 'within_polygon', 'near',
-            'near_sphere', 'contains', 'icontains', 'startswith', 'istartswith', 'endswith', 'iendswith',
-            'exact', 'iexact', 'match']
+        filter_specs = self._meta.filter_specs
 
         for filter_expr, value in filters.items():
             filter_bits = filter_expr.split(LOOKUP_SEP)
             field_name = filter_bits.pop(0)
             filter_type = 'exact'
 
-            if not field_name in self.fields:
+            if not field_name in filter_specs:
                 # It's not a field we know about. Move along citizen.
                 continue
 
+            spec = filter_specs[field_name]
+
             # Allow the use of positional searching on ListFields
             if (len(filter_bits) and filter_bits[-1] in QUERY_TERMS) or \
-                    (len(filter_bits) and filter_bits[-1].isdigit() and \
-                        isinstance(getattr(self._meta.object_class, field_name), mongo_fields.ListField)):
+                    (len(filter_bits) and filter_bits[-1].isdigit() and spec['list']):
                 filter_type = filter_bits.pop()
 
-            lookup_bits = [field_name]
+            negated = bool(filter_bits) and filter_bits[-1] == 'not'
 
-            # Split on ',' if not empty string and either an in or range filter. We also want to get the list
-            # version of the value if the field in question is a ListField.
-            if (filter_type in ('in', 'range') and len(value)) or \
-                    isinstance(getattr(self._meta.object_class, field_name), mongo_fields.ListField):
-                if hasattr(filters, 'getlist'):
-                    if len(filters.getlist(filter_expr)) > 1:
-                        value = filters.getlist(filter_expr)
-                else:
-                    value = value.split(',')
+            if negated:
+                filter_bits.pop()
 
-            # Mongoengine requires us to search for sizes with numbers, but we will have strings so we need to
-            # convert
-            if filter_type == 'size':
-                value = int(value)
+            if filter_bits:
+                raise InvalidFilterError("'%s' is not a valid filter." % filter_expr)
 
-            db_field_name = LOOKUP_SEP.join(lookup_bits)
-            qs_filter = "%s%s%s" % (db_field_name, LOOKUP_SEP, filter_type)
-            qs_filters[qs_filter] = value
+            if spec['terms'] is not None:
+                if not spec['terms']:
+                    raise InvalidFilterError("The '%s' field does not allow filtering." % field_name)
 
-        return dict_strip_unicode_keys(qs_filters)
+                if not ('exact' if filter_type.isdigit() else filter_type) in spec['terms']:
+                    raise InvalidFilterError("'%s' is not an allowed filter on the '%s' field." % (filter_type, field_name))
 
+            if hasattr(filters, 'getlist'):
+                values = filters.getlist(filter_expr)
+            elif isinstance(value, (list, tuple)):
+                values = list(value)
+            else:
+                values = [value]
 
-    def obj_get_list(self, request=None, **kwargs):
-        """
-        A ORM-specific implementation of ``obj_get_list``.
+            try:
+                value = self.coerce_filter_value(spec, filter_type, values)
+            except (ValueError, TypeError, AttributeError, ArithmeticError, InvalidId):
+                raise BadRequest("Invalid value '%s' provided for the '%s' filter." % (','.join(unicode(item) for item in values), filter_expr))
 
-        Takes an optional ``request`` object, whose ``GET`` dictionary can be
-        used to narrow the query.
-        """
-        filters = None
+            lookup_bits = [spec['lookup']]
 
-        if hasattr(request, 'GET'):
-            filters = request.GET
+            # mongoengine's ``exact`` is a regex on strings, plain equality
+            # can use the index and compares lists as a whole.
+            if filter_type == 'exact':
+                if negated:
+                    lookup_bits.append('ne')
+            else:
+                if negated:
+                    lookup_bits.append('not')
 
-        applicable_filters = self.build_filters(filters=filters)
+                lookup_bits.append(filter_type)
 
-        try:
-            return self.get_object_list(request).filter(**applicable_filters)
-        except ValueError, e:
-            raise NotFound("Invalid resource lookup data provided (mismatched type).")
+            qs_filters[LOOKUP_SEP.join(lookup_bits)] = value
 
-    def obj_get(self, request=None, **kwargs):
-        """
-        A ORM-specific implementation of ``obj_get``.
+        return dict_strip_unicode_keys(qs_filters)
 
-        Takes optional ``kwargs``, which are used to narrow the query to find
-        the instance.
+    def coerce_filter_value(self, spec, filter_type, values):
         """
-        try:
-            return self.get_object_list(request).get(**kwargs)
-        except ValueError, e:
-            raise NotFound("Invalid resource lookup data provided (mismatched type).")
+        Converts the query string ``values`` of a filter to the types its
+        query term and field need.
 
-    def obj_delete_list(self, request=None, **kwargs):
+        Exact filters on ``ListField`` s split their values on ``,``, so
+        ``?tags=a,b`` matches the list ``['a', 'b']`` and ``?tags=a`` every
+        list containing ``'a'``.
         """
-        A ORM-specific implementation of ``obj_delete_list``.
+        coerce = spec['coerce'] or (lambda value: value)
+        value = values[-1]
 
-        Takes optional ``kwargs``, which can be used to narrow the query.
+        if filter_type in LIST_QUERY_TERMS:
+            return [coerce(item) for value in values for item in value.split(',') if item]
+
+        if filter_type == 'size':
+            return int(value)
+
+        if filter_type == 'exists':
+            return _to_bool(value)
+
+        if filter_type == 'mod':
+            divisor, remainder = value.split(',')
+            return [int(divisor), int(remainder)]
+
+        if filter_type in RAW_QUERY_TERMS:
+            return value
+
+        # Comma separated or repeated values look for the exact list, a
+        # single value for an element of the list.
+        if spec['list'] and filter_type == 'exact':
+            items = [item for value in values for item in value.split(',') if item]
+
+            if len(items) > 1:
+                return [coerce(item) for item in items]
+
+            return coerce(items and items[0] or value)
+
+        return coerce(value)
+
+    def full_dehydrate(self, bundle):
         """
-        self.get_object_list(request).filter(**kwargs).delete()
+        Given a bundle with an object instance, extract the information from it
+        to populate the resource.
 
-    def obj_delete(self, request=None, **kwargs):
+        If ``get_list`` or ``get_detail`` narrowed the bundle to the fields
+        requested with ``?fields=`` only those are dehydrated
+        (``resource_uri`` is always included).
         """
-        A ORM-specific implementation of ``obj_delete``.
+        requested = getattr(bundle, 'requested_fields', None)
+        obj = bundle.obj
+        concurrent = []
+
+        # Resources dehydrated inside the pool run sequentially, so they
+        # cannot wait for threads of the pool themselves.
+        concurrent_dehydration = getattr(self._meta, 'concurrent_dehydration', False) and \
+            not getattr(_dehydration_local, 'in_pool', False)
+        related_count = self._meta.related_field_count
+
+        # Dehydrate each field by running the plan compiled for the class.
+        for field_name, attribute, method_name in self._meta.dehydration_plan:
+            if requested is not None and not field_name in requested and field_name != 'resource_uri':
+                continue
 
-        Takes optional ``kwargs``, which are used to narrow the query to find
-        the instance.
+            field_object = self.fields[field_name]
+
+            if attribute is not None:
+                value = getattr(obj, attribute, None)
+
+                # Let the field handle defaults, nulls and callables.
+                if value is None or callable(value):
+                    bundle.data[field_name] = field_object.dehydrate(bundle)
+                else:
+                    bundle.data[field_name] = field_object.convert(value)
+            else:
+                # A touch leaky but it makes URI resolution work.
+                if getattr(field_object, 'dehydrated_type', None) == 'related':
+                    field_object.api_name = self._meta.api_name
+                    field_object.resource_name = self._meta.resource_name
+
+                    if concurrent_dehydration and related_count > 1:
+                        concurrent.append((field_name, field_object, method_name))
+                        continue
+
+                    with Phase('dehydrate_related'):
+                        bundle.data[field_name] = field_object.dehydrate(bundle)
+                else:
+                    bundle.data[field_name] = field_object.dehydrate(bundle)
+
+            # Run the optional method to do further dehydration.
+            if method_name is not None:
+                bundle.data[field_name] = getattr(self, method_name)(bundle)
+
+        if concurrent:
+            self.dehydrate_concurrently(bundle, concurrent)
+
+        if getattr(bundle, 'include_search_score', False):
+            bundle.data['score'] = _text_score(obj)
+
+        # Files link to the endpoint that serves their content.
+        for field_name in self._meta.file_fields:
+            if bundle.data.get(field_name) is not None and obj.pk is not None:
+                bundle.data[field_name]['uri'] = self.get_file_uri(bundle, field_name)
+
+        bundle = self.dehydrate(bundle)
+        return bundle
+
+    def dehydrate_concurrently(self, bundle, related):
         """
-        try:
-            obj = self.get_object_list(request).get(**kwargs)
-        except DoesNotExist:
-            raise NotFound("A model instance matching the provided arguments could not be found.")
+        Dehydrates the related fields in ``related``, a list of
+        ``(field_name, field_object, method_name)`` tuples, in parallel on
+        the shared thread pool.
+
+        At most ``concurrent_dehydration`` fields (4 if it is ``True``) of a
+        request are fetched at the same time. The results are added to the
+        bundle in the order of ``related``. If fields fail, their errors are
+        added to ``bundle.errors`` (if the bundle has them) and the first
+        error is raised.
+        """
+        limit = self._meta.concurrent_dehydration
 
-        obj.delete()
+        if limit is True:
+            limit = 4
 
-    def get_resource_uri(self, bundle_or_obj):
+        pool = _get_dehydration_pool()
+        stats = current_stats()
+        errors = []
+
+        with Phase('dehydrate_related'):
+            for start in xrange(0, len(related), limit):
+                batch = related[start:start + limit]
+                results = [pool.apply_async(_dehydrate_in_pool, (stats, field_object, bundle)) for field_name, field_object, method_name in batch]
+
+                for (field_name, field_object, method_name), result in zip(batch, results):
+                    try:
+                        bundle.data[field_name] = result.get()
+                    except Exception, e:
+                        errors.append((field_name, e))
+
+        if errors:
+            if hasattr(bundle, 'errors'):
+                resource_errors = bundle.errors.setdefault(self._meta.resource_name, {})
+
+                for field_name, e in errors:
+                    resource_errors[field_name] = unicode(e)
+
+            raise errors[0][1]
+
+        # Run the optional methods to do further dehydration.
+        for field_name, field_object, method_name in related:
+            if method_name is not None:
+                bundle.data[field_name] = getattr(self, method_name)(bundle)
+
+    def apply_sorting(self, obj_list, options=None):
         """
-        Handles generating a resource URI for a single resource.
+        Sorts ``obj_list`` by the resource fields given with ``order_by``
+        (prefixed with ``-`` for descending order). Multiple fields can be
+        given comma separated or as repeated parameters.
 
-        Uses the model's ``pk`` in order to create the URI.
+        Only fields listed in ``ordering`` on ``Meta`` can be used, others
+        raise ``BadRequest`` (tastypie's ``InvalidSortError`` would give a
+        500).
         """
-        kwargs = {
-          'resource_name': self._meta.resource_name,
-        }
-        
-        # make sure pk is a str, because mongoengine loves
-        # to pass ObjectIds around.
-        if isinstance(bundle_or_obj, Bundle):
-            kwargs['pk'] = str(bundle_or_obj.obj.pk)
+        if options is None:
+            options = {}
+
+        if not 'order_by' in options:
+            return obj_list
+
+        if hasattr(options, 'getlist'):
+            values = options.getlist('order_by')
         else:
-            kwargs['pk'] = str(bundle_or_obj.pk)
+            values = options['order_by']
 
-        if self._meta.api_name is not None:
-            kwargs['api_name'] = self._meta.api_name
+            if isinstance(values, basestring):
+                values = [values]
 
-        return self._build_reverse_url("api_dispatch_detail", kwargs=kwargs)
-    
-    def obj_create(self, bundle, request=None, **kwargs):
-        bundle.obj = self._meta.object_class()
-        
+        order_by_args = []
+        document_type = self._meta.object_class
+
+        for value in values:
+            for order_by in value.split(','):
+                field_name = order_by.lstrip('-')
+
+                if not field_name in self.fields:
+                    raise BadRequest("No matching '%s' field for ordering on." % field_name)
+
+                if not field_name in self._meta.ordering:
+                    raise BadRequest("The '%s' field does not allow ordering." % field_name)
+
+                attribute = self.fields[field_name].attribute
+
+                if not isinstance(attribute, basestring) or not attribute in document_type._fields:
+                    raise BadRequest("The '%s' field has no document field for ordering on." % field_name)
+
+                order_by_args.append('%s%s' % (order_by.startswith('-') and '-' or '', attribute))
+
+        return obj_list.order_by(*order_by_args)
+
+    def get_index_keys(self):
+        """
+        Returns the keys of all indexes of the resource's collection, both
+        those declared in the document's ``meta['indexes']`` and those that
+        exist on the server. Every index is a list of ``db_field`` names.
+
+        The indexes are read once per resource instance.
+        """
+        index_keys = getattr(self, '_index_keys', None)
+
+        if index_keys is not None:
+            return index_keys
+
+        document_type = self._meta.object_class
+        index_keys = [['_id']]
+
+        for spec in document_type._meta.get('index_specs') or []:
+            index_keys.append([key for key, direction in spec['fields']])
+
+        for info in document_type._get_collection().index_information().values():
+            index_keys.append([key for key, direction in info['key']])
+
+        self._index_keys = index_keys
+        return index_keys
+
+    def get_unindexed_lookups(self, query, ordering):
+        """
+        Returns a list of the parts of ``query`` (a raw MongoDB query) and
+        ``ordering`` (a list of ``(db_field, direction)``) that cannot be
+        answered with one of the collection's indexes.
+        """
+        problems = []
+        indexed_fields = set()
+
+        for key, value in query.items():
+            # Searches use the text index.
+            if key == '$text':
+                continue
+
+            if key.startswith('$'):
+                problems.append("'%s' queries" % key)
+                continue
+
+            if isinstance(value, dict) and '$regex' in value:
+                value = value['$regex']
+
+            pattern = getattr(value, 'pattern', None)
+
+            # Only case sensitive regular expressions anchored at the start
+            # can use an index.
+            if pattern is not None and (not pattern.startswith('^') or getattr(value, 'flags', 0) & re.IGNORECASE):
+                problems.append("an unanchored or case insensitive match on '%s'" % key)
+                continue
+
+            indexed_fields.add(key)
+
+        index_keys = self.get_index_keys()
+
+        if indexed_fields and not any(keys[0] in indexed_fields for keys in index_keys):
+            problems.append("the filters on %s" % ', '.join("'%s'" % key for key in sorted(indexed_fields)))
+
+        for key, direction in ordering:
+            # Sorting by relevance (``{'$meta': 'textScore'}``) uses the
+            # text index of the search.
+            if isinstance(direction, dict):
+                continue
+
+            supported = False
+
+            for keys in index_keys:
+                if key in keys and all(prefix in indexed_fields for prefix in keys[:keys.index(key)]):
+                    supported = True
+                    break
+
+            if not supported:
+                problems.append("sorting by '%s'" % key)
+
+        return problems
+
+    @classmethod
+    def check_search_fields(cls):
+        """
+        Makes sure the document declares a text index in its
+        ``meta['indexes']`` (e.g. ``{'fields': ['$title', '$body']}``) that
+        covers all ``search_fields``. Building one inside a request is too
+        expensive, so resources without it cannot be created.
+        """
+        search_fields = getattr(cls._meta, 'search_fields', None)
+
+        if not search_fields:
+            return
+
+        document_type = cls._meta.object_class
+        text_keys = set()
+
+        for spec in document_type._meta.get('index_specs') or []:
+            text_keys.update(key for key, direction in spec['fields'] if direction == 'text')
+
+        if not text_keys:
+            raise TastypieError("%s has search_fields, but %s declares no text index in its meta['indexes']." % (cls.__name__, document_type.__name__))
+
+        # A wildcard text index covers every field.
+        if '$**' in text_keys:
+            return
+
+        for field_name in search_fields:
+            field_object = cls.base_fields.get(field_name)
+            attribute = field_object is not None and field_object.attribute or field_name
+            document_field = isinstance(attribute, basestring) and document_type._fields.get(attribute) or None
+
+            if document_field is None or not document_field.db_field in text_keys:
+                raise TastypieError("The search field '%s' of %s is not in the text index of %s." % (field_name, cls.__name__, document_type.__name__))
+
+    def apply_search(self, request, object_list):
+        """
+        Limits ``object_list`` to the documents matching the ``q`` parameter
+        using the collection's text index (``$text``).
+
+        Search has to be enabled with ``search_fields`` on ``Meta``. Results
+        are sorted by relevance unless ``order_by`` is given.
+        """
+        if not getattr(self._meta, 'search_fields', None) or not hasattr(request, 'GET'):
+            return object_list
+
+        query = request.GET.get('q')
+
+        if not query:
+            return object_list
+
+        object_list = object_list.search_text(query)
+
+        if not 'order_by' in request.GET:
+            object_list = object_list.order_by('$text_score')
+
+        return object_list
+
+    def check_index_usage(self, object_list):
+        """
+        Checks if the query of ``object_list`` can be answered with the
+        collection's indexes.
+
+        Depending on ``index_policy`` on ``Meta`` queries that would scan the
+        collection or sort in memory are logged (``'warn'``) or rejected
+        (``'strict'``). By default they are not checked.
+        """
+        index_policy = getattr(self._meta, 'index_policy', None)
+
+        if index_policy is None:
+            return
+
+        ordering = getattr(object_list, '_ordering', None) or []
+        problems = self.get_unindexed_lookups(object_list._query, ordering)
+
+        if not problems:
+            return
+
+        message = "The query cannot use an index for %s." % ', '.join(problems)
+
+        if index_policy == 'strict':
+            raise BadRequest(message)
+
+        logger.warning("%s: %s", self._meta.resource_name, message)
+
+    def obj_get_list(self, request=None, **kwargs):
+        """
+        A ORM-specific implementation of ``obj_get_list``.
+
+        Takes an optional ``request`` object, whose ``GET`` dictionary can be
+        used to narrow the query.
+        """
+        filters = None
+
+        if hasattr(request, 'GET'):
+            filters = request.GET
+
+        applicable_filters = self.build_filters(filters=filters)
+
+        try:
+            object_list = self.get_object_list(request).filter(**applicable_filters)
+        except ValueError, e:
+            raise NotFound("Invalid resource lookup data provided (mismatched type).")
+
+        object_list = self.apply_search(request, object_list)
+
+        # Read only list requests can skip building documents, see
+        # ``prepare_objects``.
+        if getattr(self._meta, 'raw_reads', False) and getattr(request, 'method', None) == 'GET':
+            object_list = object_list.as_pymongo()
+
+        return object_list
+
+    def dereference_objects(self, objects):
+        """
+        Fetches the documents referenced by ``objects`` in batches.
+
+        Collects the ids of every related field (``ToOneField`` and
+        ``ReferenceList``) across all objects and loads each target collection
+        with a single ``$in`` query. The fetched documents are put back on the
+        objects, so dehydrating the related fields does not hit the database
+        once per object.
+        """
+        objects = list(objects)
+
+        for field_name, field_object in self.fields.items():
+            if not isinstance(field_object, tasty_fields.RelatedField):
+                continue
+
+            attribute = field_object.attribute
+
+            # Only plain document fields can be batched, callables and
+            # lookups spanning documents are left to the field.
+            if not isinstance(attribute, basestring) or not attribute in self._meta.object_class._fields:
+                continue
+
+            document_type = field_object.to_class._meta.object_class
+
+            if document_type is None:
+                continue
+
+            ids = set()
+
+            for obj in objects:
+                value = obj._data.get(attribute)
+
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+
+                for item in value:
+                    ref_id = _reference_id(item)
+                    if ref_id is not None:
+                        ids.add(ref_id)
+
+            if not ids:
+                continue
+
+            documents = document_type.objects.in_bulk(list(ids))
+
+            # References without a matching document are left untouched so
+            # mongoengine handles them like it always does.
+            for obj in objects:
+                value = obj._data.get(attribute)
+
+                if isinstance(value, (list, tuple)):
+                    obj._data[attribute] = [documents.get(_reference_id(item), item) for item in value]
+                elif value is not None:
+                    obj._data[attribute] = documents.get(_reference_id(value), value)
+
+        return objects
+
+    def prepare_objects(self, request, objects):
+        """
+        Prepares a page of objects before they are dehydrated.
+
+        If ``batch_dereference`` is set on the resource's ``Meta`` the
+        references of all objects are fetched in batches. With ``raw_reads``
+        the raw data is wrapped in ``RawDocument`` instances, whose references
+        are always fetched in batches.
+        """
+        raw_reads = getattr(self._meta, 'raw_reads', False)
+
+        if raw_reads:
+            field_map = self._meta.raw_field_map
+            document_type = self._meta.object_class
+            projected = self._meta.projection_map is not None
+            objects = [
+                isinstance(obj, dict) and RawDocument(document_type, obj, field_map, projected) or obj
+                for obj in objects
+            ]
+
+        if self._meta.file_fields:
+            objects = self.prefetch_files(objects)
+
+        if raw_reads or getattr(self._meta, 'batch_dereference', False):
+            return self.dereference_objects(objects)
+
+        return objects
+
+    def prefetch_files(self, objects):
+        """
+        Loads the GridFS metadata of the files in the ``FileField`` s of
+        ``objects`` with one query per files collection, so dehydrating
+        them does not query once per object.
+        """
+        objects = list(objects)
+        proxies = {}
+
+        for field_name in self._meta.file_fields:
+            attribute = self.fields[field_name].attribute
+
+            for obj in objects:
+                proxy = getattr(obj, attribute, None)
+
+                if proxy and proxy.gridout is None:
+                    proxies.setdefault((proxy.db_alias, proxy.collection_name), []).append(proxy)
+
+        for (db_alias, collection_name), collection_proxies in proxies.items():
+            root_collection = get_db(db_alias)[collection_name]
+            ids = list(set(proxy.grid_id for proxy in collection_proxies))
+            documents = dict((document['_id'], document) for document in root_collection.files.find({'_id': {'$in': ids}}))
+
+            # ``GridFSProxy.get()`` returns the cached ``GridOut``.
+            for proxy in collection_proxies:
+                document = documents.get(proxy.grid_id)
+
+                if document is not None:
+                    proxy.gridout = GridOut(root_collection, file_document=document)
+
+        return objects
+
+    def dispatch(self, request_type, request, **kwargs):
+        """
+        Handles the common operations (allowed HTTP method, authentication,
+        throttling, method lookup) surrounding most CRUD interactions.
+
+        If ``instrumentation`` is set on ``Meta`` (see
+        ``mangopie.instrumentation.QueryInstrumentation``) the MongoDB
+        commands of the request are measured. With ``read_your_writes`` a
+        client that wrote successfully reads from the primary for that many
+        seconds.
+        """
+        instrumentation = getattr(self._meta, 'instrumentation', None)
+        dispatch = super(DocumentResource, self).dispatch
+
+        if instrumentation is None:
+            response = dispatch(request_type, request, **kwargs)
+        else:
+            response = instrumentation.dispatch(self, request, lambda: dispatch(request_type, request, **kwargs))
+
+        # Send the client's reads to the primary for a while so it sees
+        # its own writes.
+        read_your_writes = getattr(self._meta, 'read_your_writes', 0)
+
+        if read_your_writes and request.method in WRITE_METHODS and response.status_code < 400:
+            django_cache.set(self.get_client_key(request), True, read_your_writes)
+
+        return response
+
+    def get_list(self, request, **kwargs):
+        """
+        Returns a serialized list of resources.
+
+        Works like tastypie's ``get_list`` but hands the paginated objects to
+        ``prepare_objects`` before they are dehydrated. Responses are cached
+        if ``response_cache`` is set on ``Meta``.
+        """
+        response_cache = getattr(self._meta, 'response_cache', None)
+
+        if response_cache is not None:
+            return response_cache.get_response(self, request, lambda: self._get_list(request, **kwargs))
+
+        return self._get_list(request, **kwargs)
+
+    def _get_list(self, request, **kwargs):
+        with Phase('obj_get_list'):
+            objects = self.obj_get_list(request=request, **self.remove_api_resource_names(kwargs))
+            sorted_objects = self.apply_sorting(objects, options=request.GET)
+            self.check_index_usage(sorted_objects)
+
+            # tastypie's ``dispatch`` replaces responses that are not an
+            # ``HttpResponse`` (like ``StreamingHttpResponse`` on Django 1.5
+            # and later) with an empty one, ``wrap_view`` passes this through.
+            if self.should_stream(request):
+                raise ImmediateHttpResponse(response=self.create_streaming_response(request, sorted_objects))
+
+            paginator = self._meta.paginator_class(request.GET, sorted_objects, resource_uri=self.get_resource_list_uri(), limit=self._meta.limit, **self.get_paginator_kwargs())
+            to_be_serialized = paginator.page()
+
+            # Show how MongoDB runs the query to help with adding indexes.
+            if settings.DEBUG and request.GET.get('explain'):
+                to_be_serialized['meta']['explain'] = json.loads(json_util.dumps(sorted_objects.explain()))
+
+        with Phase('dehydrate_related'):
+            page_objects = self.prepare_objects(request, to_be_serialized['objects'])
+
+        # Dehydrate the bundles in preparation for serialization.
+        bundles = [self.build_bundle(obj=obj, request=request) for obj in page_objects]
+        requested = self.get_requested_fields(request)
+        include_search_score = self.should_include_search_score(request)
+
+        for bundle in bundles:
+            bundle.requested_fields = requested
+            bundle.include_search_score = include_search_score
+
+        to_be_serialized['objects'] = [self.full_dehydrate(bundle) for bundle in bundles]
+        to_be_serialized = self.alter_list_data_to_serialize(request, to_be_serialized)
+        return self.create_response(request, to_be_serialized)
+
+    def should_include_search_score(self, request):
+        """
+        Returns if the relevance of a search result should be added to the
+        objects as ``score``, which is requested with ``?score=1``.
+        """
+        return bool(getattr(self._meta, 'search_fields', None) and request.GET.get('q') and request.GET.get('score'))
+
+    def get_paginator_kwargs(self):
+        """
+        Returns the options of mangopie's paginators, set by ``count_strategy``
+        and ``count_cache_timeout`` on ``Meta``.
+        """
+        if not issubclass(self._meta.paginator_class, Paginator):
+            return {}
+
+        kwargs = {}
+
+        if hasattr(self._meta, 'count_strategy'):
+            kwargs['count_strategy'] = self._meta.count_strategy
+
+        if hasattr(self._meta, 'count_cache_timeout'):
+            kwargs['count_cache_timeout'] = self._meta.count_cache_timeout
+
+        return kwargs
+
+    def override_urls(self):
+        """
+        Adds the ``aggregate`` endpoint of the resource if ``aggregation`` is
+        set on ``Meta`` and the endpoint serving the files of ``FileField`` s.
+        """
+        urls = []
+
+        if self._meta.file_fields:
+            urls.append(url(r"^(?P<resource_name>%s)/(?P<pk>\w[\w-]*)/files/(?P<field_name>\w+)%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('dispatch_file'), name="api_dispatch_file"))
+
+        if getattr(self._meta, 'aggregation', False):
+            urls.insert(0, url(r"^(?P<resource_name>%s)/aggregate%s$" % (self._meta.resource_name, trailing_slash()), self.wrap_view('dispatch_aggregate'), name="api_dispatch_aggregate"))
+
+        return urls
+
+    def dispatch_aggregate(self, request, **kwargs):
+        """
+        Checks the request like ``dispatch`` does for a ``GET`` of the list
+        and returns the result of ``get_aggregate``.
+        """
+        if not getattr(self._meta, 'aggregation', False):
+            return http.HttpNotFound()
+
+        allowed_methods = [method for method in self._meta.list_allowed_methods if method == 'get']
+        self.method_check(request, allowed=allowed_methods)
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        self.throttle_check(request)
+        self.log_throttled_access(request)
+        return self.get_aggregate(request, **self.remove_api_resource_names(kwargs))
+
+    def _aggregate_field(self, field_name):
+        """
+        Returns the resource field and the document field for ``field_name``.
+        """
+        if not field_name in self.fields:
+            raise BadRequest("No matching '%s' field for aggregation." % field_name)
+
+        field_object = self.fields[field_name]
+        attribute = field_object.attribute
+
+        if not isinstance(attribute, basestring) or not attribute in self._meta.object_class._fields:
+            raise BadRequest("The '%s' field has no document field for aggregation." % field_name)
+
+        return field_object, self._meta.object_class._fields[attribute]
+
+    def build_aggregate_pipeline(self, request):
+        """
+        Builds the aggregation pipeline for a request like
+        ``?group_by=author&count=1&sum=views``.
+
+        The filters of the request are used for ``$match``, list fields are
+        unwound before grouping. ``sum``, ``avg``, ``min`` and ``max`` take
+        numeric fields (comma separated or repeated), their results are named
+        like ``sum_views``. Groups are sorted by their count (or key) and
+        limited by ``limit``.
+        """
+        group_by = request.GET.get('group_by')
+
+        if not group_by:
+            raise BadRequest("The 'group_by' parameter is required.")
+
+        field_object, document_field = self._aggregate_field(group_by)
+        key = '$%s' % document_field.db_field
+        pipeline = []
+
+        match = self.obj_get_list(request=request)._query
+
+        if match:
+            pipeline.append({'$match': match})
+
+        if isinstance(document_field, mongo_fields.ListField):
+            pipeline.append({'$unwind': key})
+
+        group = {'_id': key}
+
+        if request.GET.get('count'):
+            group['count'] = {'$sum': 1}
+
+        for operator in AGGREGATE_OPERATORS:
+            for value in request.GET.getlist(operator):
+                for field_name in value.split(','):
+                    numeric_field = self._aggregate_field(field_name)[1]
+
+                    if not isinstance(numeric_field, (mongo_fields.IntField, mongo_fields.FloatField, mongo_fields.DecimalField)):
+                        raise BadRequest("The '%s' field is not numeric." % field_name)
+
+                    group['%s_%s' % (operator, field_name)] = {'$%s' % operator: '$%s' % numeric_field.db_field}
+
+        pipeline.append({'$group': group})
+        pipeline.append({'$sort': 'count' in group and SON([('count', -1), ('_id', 1)]) or {'_id': 1}})
+
+        try:
+            limit = int(request.GET.get('limit', self._meta.limit))
+        except ValueError:
+            raise BadRequest("Invalid limit '%s' provided." % request.GET.get('limit'))
+
+        if limit:
+            pipeline.append({'$limit': limit})
+
+        return pipeline
+
+    def dehydrate_aggregate_keys(self, request, field_object, keys):
+        """
+        Dehydrates the group keys of an aggregation. References are fetched
+        in a single query per related collection.
+        """
+        if isinstance(field_object, tasty_fields.RelatedField):
+            related_resource = field_object.to_class()
+            ids = [_reference_id(key) for key in keys if key is not None]
+            documents = related_resource._meta.object_class.objects.in_bulk(ids)
+            dehydrated = []
+
+            for key in keys:
+                document = documents.get(_reference_id(key))
+
+                if document is None:
+                    dehydrated.append(None)
+                elif field_object.full:
+                    dehydrated.append(related_resource.full_dehydrate(related_resource.build_bundle(obj=document, request=request)))
+                else:
+                    dehydrated.append(related_resource.get_resource_uri(document))
+
+            return dehydrated
+
+        if isinstance(field_object, fields.ListField):
+            field_object = field_object.inner_field
+
+        return [field_object.convert(key) if key is not None else None for key in keys]
+
+    def get_aggregate(self, request, **kwargs):
+        """
+        Returns the grouped results of a MongoDB aggregation over the
+        (filtered) objects of the resource.
+        """
+        field_name = request.GET.get('group_by')
+        pipeline = self.build_aggregate_pipeline(request)
+
+        collection = self._meta.object_class._get_collection()
+        read_preference = self.get_read_preference(request)
+
+        if read_preference is not None:
+            collection = collection.with_options(read_preference=read_preference)
+
+        with Phase('aggregate'):
+            results = list(collection.aggregate(pipeline))
+
+        field_object = self.fields[field_name]
+        keys = self.dehydrate_aggregate_keys(request, field_object, [result.pop('_id') for result in results])
+
+        for key, result in zip(keys, results):
+            result[field_name] = key
+
+        return self.create_response(request, {
+            'meta': {
+                'group_by': field_name,
+                'total_count': len(results),
+            },
+            'objects': results,
+        })
+
+    def get_file_uri(self, bundle, field_name):
+        """
+        Returns the URI of the endpoint serving the file in ``field_name``.
+        """
+        kwargs = {
+            'resource_name': self._meta.resource_name,
+            'pk': str(bundle.obj.pk),
+            'field_name': field_name,
+        }
+
+        if self._meta.api_name is not None:
+            kwargs['api_name'] = self._meta.api_name
+
+        return self._build_reverse_url("api_dispatch_file", kwargs=kwargs)
+
+    def dispatch_file(self, request, **kwargs):
+        """
+        Serves (``GET``) or replaces (``PUT``) the GridFS file stored in the
+        ``FileField`` ``field_name`` of a document.
+        """
+        # Downloads are reads and uploads updates of the document.
+        allowed_methods = [method for method in self._meta.detail_allowed_methods if method in ('get', 'put')]
+
+        if 'get' in allowed_methods:
+            allowed_methods.append('head')
+
+        self.method_check(request, allowed=allowed_methods)
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        self.throttle_check(request)
+        self.log_throttled_access(request)
+
+        kwargs = self.remove_api_resource_names(kwargs)
+        field_name = kwargs.pop('field_name')
+
+        if not field_name in self._meta.file_fields:
+            return http.HttpNotFound()
+
+        try:
+            obj = self.cached_obj_get(request=request, **kwargs)
+        except (ObjectDoesNotExist, DoesNotExist):
+            return http.HttpNotFound()
+        except (MultipleObjectsReturned, MultipleDocumentsReturned):
+            return http.HttpMultipleChoices("More than one resource is found at this URI.")
+
+        if request.method == 'PUT':
+            return self.put_file(request, obj, field_name)
+
+        return self.get_file(request, obj, field_name)
+
+    def parse_range(self, header, length):
+        """
+        Returns the first and last byte of the range requested with a
+        ``Range`` header or ``None`` if the whole file should be sent.
+        Raises ``ValueError`` if the range cannot be satisfied.
+
+        Only single ranges are supported, others are ignored.
+        """
+        match = header and RANGE_RE.match(header.strip())
+
+        if not match:
+            return None
+
+        first, last = match.groups()
+
+        if not first and not last:
+            return None
+
+        if not first:
+            # A suffix range like ``bytes=-500``.
+            first, last = max(length - int(last), 0), length - 1
+        else:
+            first = int(first)
+            last = min(int(last), length - 1) if last else length - 1
+
+        if first > last or first >= length:
+            raise ValueError("Range '%s' not satisfiable." % header)
+
+        return first, last
+
+    def stream_file(self, grid_out, length):
+        """
+        Yields ``length`` bytes from the current position of ``grid_out``
+        one GridFS chunk at a time.
+        """
+        remaining = length
+
+        while remaining > 0:
+            data = grid_out.read(min(grid_out.chunk_size, remaining))
+
+            if not data:
+                break
+
+            remaining -= len(data)
+            yield data
+
+    def get_file(self, request, obj, field_name):
+        """
+        Streams the file stored in ``field_name`` of ``obj`` from GridFS.
+
+        Supports conditional requests with ``If-None-Match`` (the ``ETag`` is
+        the file's md5 or its id and length) and single byte ranges.
+        """
+        proxy = getattr(obj, self.fields[field_name].attribute)
+        grid_out = proxy.get() if proxy else None
+
+        if grid_out is None:
+            return http.HttpNotFound()
+
+        length = grid_out.length
+        etag = '"%s"' % (getattr(grid_out, 'md5', None) or '%s-%s' % (grid_out._id, length))
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+
+        if if_none_match is not None and (etag in [value.strip() for value in if_none_match.split(',')] or if_none_match.strip() == '*'):
+            response = http.HttpNotModified()
+            response['ETag'] = etag
+            return response
+
+        try:
+            byte_range = self.parse_range(request.META.get('HTTP_RANGE'), length)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */%s' % length
+            return response
+
+        # Ranges of an outdated version of the file are not sent.
+        if_range = request.META.get('HTTP_IF_RANGE')
+
+        if byte_range is not None and if_range is not None and if_range.strip() != etag:
+            byte_range = None
+
+        first, last = byte_range or (0, length - 1)
+        grid_out.seek(first)
+
+        content_type = grid_out.content_type or 'application/octet-stream'
+        response = StreamingHttpResponse(self.stream_file(grid_out, last - first + 1), content_type=content_type)
+        response['Content-Length'] = str(max(last - first + 1, 0))
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+
+        if grid_out.upload_date is not None:
+            response['Last-Modified'] = http_date(calendar.timegm(grid_out.upload_date.utctimetuple()))
+
+        if byte_range is not None:
+            response.status_code = 206
+            response['Content-Range'] = 'bytes %s-%s/%s' % (first, last, length)
+
+        return response
+
+    def put_file(self, request, obj, field_name):
+        """
+        Streams the request body into a new GridFS file and stores it in
+        ``field_name`` of ``obj``. The previous file is deleted once the
+        document is saved.
+
+        The body is read in pieces of ``file_chunk_size`` bytes (255 KB by
+        default), the file name can be given with ``?filename=``.
+        """
+        attribute = self.fields[field_name].attribute
+        proxy = getattr(obj, attribute)
+        previous_id = proxy.grid_id
+        chunk_size = getattr(self._meta, 'file_chunk_size', 255 * 1024)
+
+        with Phase('put_file'):
+            proxy.new_file(
+                content_type=request.META.get('CONTENT_TYPE') or 'application/octet-stream',
+                filename=request.GET.get('filename'),
+                chunk_size=chunk_size,
+            )
+
+            try:
+                while True:
+                    data = request.read(chunk_size)
+
+                    if not data:
+                        break
+
+                    proxy.write(data)
+            except:
+                # Remove the chunks written so far.
+                proxy.newfile.abort()
+                raise
+
+            proxy.close()
+
+            setattr(obj, attribute, proxy)
+            obj.save()
+
+            if previous_id is not None:
+                proxy.fs.delete(previous_id)
+
+        response = http.HttpNoContent()
+        response['Location'] = self.get_file_uri(self.build_bundle(obj=obj, request=request), field_name)
+        return response
+
+    def should_stream(self, request):
+        """
+        Returns if a list request should be answered with a streaming response.
+
+        Streaming has to be enabled with ``streaming = True`` on ``Meta`` and is
+        only used for unlimited (``?limit=0``) requests in JSON or NDJSON
+        (``?format=ndjson`` or ``Accept: application/x-ndjson``).
+        """
+        if not getattr(self._meta, 'streaming', False):
+            return False
+
+        limit = request.GET.get('limit', self._meta.limit)
+
+        if str(limit) != '0':
+            return False
+
+        return self.get_stream_format(request) is not None
+
+    def get_stream_format(self, request):
+        """
+        Returns ``'json'`` or ``'ndjson'`` depending on the requested format or
+        ``None`` if the format cannot be streamed.
+        """
+        if request.GET.get('format') == 'ndjson' or 'application/x-ndjson' in request.META.get('HTTP_ACCEPT', ''):
+            return 'ndjson'
+
+        if self.determine_format(request) == 'application/json':
+            return 'json'
+
+        return None
+
+    def stream_list(self, request, objects, stream_format):
+        """
+        Walks the cursor of ``objects`` in batches of ``stream_batch_size``
+        (100 by default) and yields the serialized objects batch by batch.
+
+        With ``json`` the chunks add up to the same structure ``get_list``
+        returns, with ``ndjson`` every object is written on its own line.
+        ``alter_list_data_to_serialize`` is not called for streamed lists.
+        """
+        batch_size = getattr(self._meta, 'stream_batch_size', 100)
+        requested = self.get_requested_fields(request)
+        include_search_score = self.should_include_search_score(request)
+        separator = stream_format == 'ndjson' and '\n' or ','
+
+        if stream_format == 'json':
+            yield '{"meta": {"limit": 0, "next": null, "offset": 0, "previous": null}, "objects": ['
+
+        first = True
+        cursor = iter(objects.batch_size(batch_size))
+
+        while True:
+            batch = list(itertools.islice(cursor, batch_size))
+
+            if not batch:
+                break
+
+            chunks = []
+
+            for obj in self.prepare_objects(request, batch):
+                bundle = self.build_bundle(obj=obj, request=request)
+                bundle.requested_fields = requested
+                bundle.include_search_score = include_search_score
+                bundle = self.full_dehydrate(bundle)
+                chunks.append(self._meta.serializer.serialize(bundle, 'application/json'))
+
+            if not first and stream_format == 'json':
+                yield separator
+
+            first = False
+            yield separator.join(chunks)
+
+            if stream_format == 'ndjson':
+                yield separator
+
+        if stream_format == 'json':
+            yield ']}'
+
+    def create_streaming_response(self, request, objects):
+        """
+        Returns a response that serializes ``objects`` while it is sent, so
+        memory stays bounded for lists of any size.
+        """
+        stream_format = self.get_stream_format(request)
+        content_type = stream_format == 'ndjson' and 'application/x-ndjson' or 'application/json'
+        return StreamingHttpResponse(self.stream_list(request, objects, stream_format), content_type=content_type)
+
+    def get_detail(self, request, **kwargs):
+        """
+        Returns a single serialized resource.
+
+        Works like tastypie's ``get_detail`` but narrows the dehydrated fields
+        to the ones requested with ``?fields=``. Responses are cached if
+        ``response_cache`` is set on ``Meta``.
+        """
+        response_cache = getattr(self._meta, 'response_cache', None)
+
+        if response_cache is not None:
+            pk = self.remove_api_resource_names(kwargs).get('pk')
+            return response_cache.get_response(self, request, lambda: self._get_detail(request, **kwargs), pk=pk)
+
+        return self._get_detail(request, **kwargs)
+
+    def _get_detail(self, request, **kwargs):
+        try:
+            obj = self.cached_obj_get(request=request, **self.remove_api_resource_names(kwargs))
+        except (ObjectDoesNotExist, DoesNotExist):
+            return http.HttpNotFound()
+        except (MultipleObjectsReturned, MultipleDocumentsReturned):
+            return http.HttpMultipleChoices("More than one resource is found at this URI.")
+
+        bundle = self.build_bundle(obj=obj, request=request)
+        bundle.requested_fields = self.get_requested_fields(request)
+        bundle = self.full_dehydrate(bundle)
+        bundle = self.alter_detail_data_to_serialize(request, bundle)
+        return self.create_response(request, bundle)
+
+    def obj_get(self, request=None, **kwargs):
+        """
+        A ORM-specific implementation of ``obj_get``.
+
+        Takes optional ``kwargs``, which are used to narrow the query to find
+        the instance.
+        """
+        prefetched = getattr(_prefetch_local, 'documents', None)
+
+        # Related URIs of a bulk write were loaded in advance.
+        if prefetched is not None and kwargs.keys() == ['pk']:
+            obj = prefetched.get((self.__class__, str(kwargs['pk'])))
+
+            if obj is not None:
+                return obj
+
+        try:
+            with Phase('obj_get'):
+                return self.get_object_list(request).get(**kwargs)
+        except ValueError, e:
+            raise NotFound("Invalid resource lookup data provided (mismatched type).")
+
+    def obj_delete_list(self, request=None, **kwargs):
+        """
+        A ORM-specific implementation of ``obj_delete_list``.
+
+        Takes optional ``kwargs``, which can be used to narrow the query.
+        """
+        self.get_object_list(request).filter(**kwargs).delete()
+
+    def obj_delete(self, request=None, **kwargs):
+        """
+        A ORM-specific implementation of ``obj_delete``.
+
+        Takes optional ``kwargs``, which are used to narrow the query to find
+        the instance.
+        """
+        try:
+            obj = self.get_object_list(request).get(**kwargs)
+        except DoesNotExist:
+            raise NotFound("A model instance matching the provided arguments could not be found.")
+
+        obj.delete()
+
+    def get_resource_uri(self, bundle_or_obj):
+        """
+        Handles generating a resource URI for a single resource.
+
+        Uses the model's ``pk`` in order to create the URI.
+        """
+        kwargs = {
+          'resource_name': self._meta.resource_name,
+        }
+        
+        # make sure pk is a str, because mongoengine loves
+        # to pass ObjectIds around.
+        if isinstance(bundle_or_obj, Bundle):
+            kwargs['pk'] = str(bundle_or_obj.obj.pk)
+        else:
+            kwargs['pk'] = str(bundle_or_obj.pk)
+
+        if self._meta.api_name is not None:
+            kwargs['api_name'] = self._meta.api_name
+
+        return self._build_reverse_url("api_dispatch_detail", kwargs=kwargs)
+    
+    def obj_create(self, bundle, request=None, **kwargs):
+        bundle.obj = self._meta.object_class()
+        
         for key, value in kwargs.items():
             setattr(bundle.obj, key, value)    
         bundle = self.full_hydrate(bundle)
@@ -348,7 +2011,9 @@ class DocumentResource(Resource):
         # Run hydrate_m2m here and assign the returned values to the Listfield before
         # the object is saved.
         m2m_bundle = self.hydrate_m2m(bundle)
-        self.save_m2m(m2m_bundle)
+
+        with Phase('save_m2m'):
+            self.save_m2m(m2m_bundle)
         
         bundle.obj.save()
         return bundle
@@ -357,21 +2022,25 @@ class DocumentResource(Resource):
         if not bundle.obj or not bundle.obj.pk:
             # Attempt to hydrate data from kwargs before doing a lookup for the object.
             # This step is needed so certain values (like datetime) will pass model validation.
-            try:  
-                bundle.obj = self.get_object_list(request)._document()
-                bundle.data.update(kwargs)
-                bundle = self.full_hydrate(bundle)
-                lookup_kwargs = kwargs.copy()
-                lookup_kwargs.update(dict(
-                    (k, getattr(bundle.obj, k))
-                    for k in kwargs.keys()
-                    if getattr(bundle.obj, k) is not None))
-            except:
-                # if there is trouble hydrating the data, fall back to just
-                # using kwargs by itself (usually it only contains a "pk" key
-                # and this will work fine.
+            # A lookup by primary key works without it, so don't hydrate twice then.
+            if set(kwargs.keys()) <= set(['pk', 'id']):
                 lookup_kwargs = kwargs
-            try:  
+            else:
+                try:
+                    bundle.obj = self.get_object_list(request)._document()
+                    bundle.data.update(kwargs)
+                    bundle = self.full_hydrate(bundle)
+                    lookup_kwargs = kwargs.copy()
+                    lookup_kwargs.update(dict(
+                        (k, getattr(bundle.obj, k))
+                        for k in kwargs.keys()
+                        if getattr(bundle.obj, k) is not None))
+                except:
+                    # if there is trouble hydrating the data, fall back to just
+                    # using kwargs by itself (usually it only contains a "pk" key
+                    # and this will work fine.
+                    lookup_kwargs = kwargs
+            try:
                 bundle.obj = self.obj_get(request, **lookup_kwargs)
             except DoesNotExist:
                 raise NotFound("A model instance matching the provided arguments could not be found.")
@@ -391,11 +2060,154 @@ class DocumentResource(Resource):
         # Run hydrate_m2m here and assign the returned values to the Listfield before
         # the object is saved.
         m2m_bundle = self.hydrate_m2m(bundle)
-        self.save_m2m(m2m_bundle)
+
+        with Phase('save_m2m'):
+            self.save_m2m(m2m_bundle)
         
         bundle.obj.save()
         return bundle
     
+    def get_partial_update(self, bundle, request=None):
+        """
+        Translates the fields present in ``bundle.data`` into mongoengine's
+        update keyword arguments (``set__<field>`` and ``unset__<field>``).
+
+        Only the fields in the payload are hydrated. Related documents that are
+        new are saved, untouched fields are never looked at.
+        """
+        document_type = self._meta.object_class
+        bundle = self.hydrate(bundle)
+        update = {}
+
+        for field_name, field_object in self.fields.items():
+            if not field_name in bundle.data or field_object.readonly:
+                continue
+
+            attribute = field_object.attribute
+
+            if not isinstance(attribute, basestring) or not attribute in document_type._fields:
+                raise BadRequest("The '%s' field cannot be updated partially." % field_name)
+
+            method = getattr(self, "hydrate_%s" % field_name, None)
+
+            if method:
+                bundle = method(bundle)
+
+            if _list_operator(bundle.data.get(field_name)):
+                update.update(self.get_list_update(bundle, field_name, field_object))
+                continue
+
+            if bundle.data.get(field_name) is None:
+                if not field_object.null and not field_object.blank:
+                    raise BadRequest("The '%s' field has no data and doesn't allow a null value." % field_name)
+
+                update['unset__%s' % attribute] = 1
+                continue
+
+            if getattr(field_object, 'is_m2m', False):
+                value = [
+                    self._saved_related_obj(related_bundle)
+                    for related_bundle in field_object.hydrate_m2m(bundle)
+                ]
+            elif isinstance(field_object, tasty_fields.RelatedField):
+                value = self._saved_related_obj(field_object.hydrate(bundle))
+            else:
+                value = field_object.hydrate(bundle)
+
+            try:
+                document_type._fields[attribute].validate(value)
+            except ValidationError, e:
+                raise BadRequest("Invalid value for the '%s' field: %s" % (field_name, e))
+
+            update['set__%s' % attribute] = value
+
+        return update
+
+    def get_list_update(self, bundle, field_name, field_object):
+        """
+        Translates a list operator like ``{"$push": [...]}`` for a
+        ``ListField`` or ``ReferenceList`` into mongoengine's update keyword
+        arguments. The operators ``$push``, ``$addToSet`` and ``$pull`` are
+        supported and run server side, the list is never read.
+        """
+        operator, values = bundle.data[field_name].items()[0]
+
+        if not isinstance(values, list):
+            values = [values]
+
+        document_field = self._meta.object_class._fields[field_object.attribute]
+
+        if getattr(field_object, 'is_m2m', False):
+            values = [
+                self._saved_related_obj(field_object.build_related_resource(value, request=bundle.request))
+                for value in values if value is not None
+            ]
+        elif isinstance(field_object, fields.ListField) and not isinstance(field_object.inner_field, fields.EmbeddedResourceField):
+            values = [field_object.inner_field.convert(value) for value in values]
+        else:
+            raise BadRequest("The '%s' field does not support list operators." % field_name)
+
+        try:
+            for value in values:
+                document_field.field.validate(value)
+        except ValidationError, e:
+            raise BadRequest("Invalid value for the '%s' field: %s" % (field_name, e))
+
+        return {'%s__%s' % (LIST_OPERATORS[operator], field_object.attribute): values}
+
+    def _saved_related_obj(self, related_bundle):
+        if related_bundle.obj.pk is None:
+            related_bundle.obj.save()
+
+        return related_bundle.obj
+
+    def obj_update_partial(self, bundle, request=None, **kwargs):
+        """
+        Writes only the fields present in ``bundle.data`` with a single atomic
+        ``update_one``. The object is never read from the database.
+
+        Takes ``kwargs``, which are used to narrow the query to find the
+        object.
+        """
+        update = self.get_partial_update(bundle, request)
+
+        if not update:
+            return bundle
+
+        try:
+            updated = self.get_object_list(request).filter(**kwargs).update_one(**update)
+        except ValueError, e:
+            raise NotFound("Invalid resource lookup data provided (mismatched type).")
+
+        if not updated:
+            raise NotFound("A model instance matching the provided arguments could not be found.")
+
+        # update_one does not send signals.
+        cache.invalidate(self._meta.object_class, kwargs.get('pk'))
+        return bundle
+
+    def patch_detail(self, request, **kwargs):
+        """
+        Updates a resource in-place.
+
+        With ``partial_updates = True`` on ``Meta`` only the fields in the
+        payload are written (see ``obj_update_partial``). ``hydrate`` and
+        ``hydrate_<field>`` methods are called, but ``is_valid`` is not.
+        Payloads using list operators (see ``get_list_update``) are always
+        written as partial updates.
+        """
+        deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+
+        # List operators can only be applied by a partial update.
+        if not getattr(self._meta, 'partial_updates', False) and \
+                not any(_list_operator(value) for value in deserialized.values()):
+            return super(DocumentResource, self).patch_detail(request, **kwargs)
+
+        deserialized = self.alter_deserialized_detail_data(request, deserialized)
+        bundle = self.build_bundle(obj=self._meta.object_class(), data=dict_strip_unicode_keys(deserialized), request=request)
+        self.obj_update_partial(bundle, request=request, **self.remove_api_resource_names(kwargs))
+        return http.HttpAccepted()
+
     def save_m2m(self, bundle):
         """
         Handles assignment of m2m data on the object.
@@ -414,6 +2226,10 @@ class DocumentResource(Resource):
 
             if field_object.readonly:
                 continue
+
+            # The field was not part of the data and is left untouched.
+            if bundle.data.get(field_name) is None:
+                continue
             
             related_objs = []
             
@@ -422,15 +2238,354 @@ class DocumentResource(Resource):
                 related_objs.append(related_bundle.obj)
                 
             setattr(bundle.obj, field_object.attribute, related_objs)
-            
-            
-            
-            
-            
-            
-            
-            
-            
-            
-        
-        
+
+    def collect_m2m(self, bundle, related_documents):
+        """
+        Works like ``save_m2m`` but instead of saving the related documents
+        adds them to ``related_documents`` (a dict keyed by document class and
+        id), so they can be written in bulk. New related documents get an id
+        assigned, so the object can reference them before they are written.
+        """
+        for field_name, field_object in self.fields.items():
+            if not getattr(field_object, 'is_m2m', False):
+                continue
+
+            if not field_object.attribute:
+                continue
+
+            if field_object.readonly:
+                continue
+
+            if bundle.data.get(field_name) is None:
+                continue
+
+            related_objs = []
+
+            for related_bundle in bundle.data[field_name]:
+                related_obj = related_bundle.obj
+
+                if related_obj.pk is None:
+                    related_obj.pk = ObjectId()
+                    related_documents[(related_obj.__class__, related_obj.pk)] = related_obj
+                elif related_obj._get_changed_fields():
+                    related_documents[(related_obj.__class__, related_obj.pk)] = related_obj
+
+                related_objs.append(related_obj)
+
+            setattr(bundle.obj, field_object.attribute, related_objs)
+
+    def build_bulk_bundle(self, request, data, obj):
+        """
+        Builds the bundle for a single item of a bulk write. For existing
+        objects the new data is merged into their current state, like
+        tastypie's ``patch_list`` does.
+        """
+        bundle = self.build_bundle(obj=obj, request=request)
+
+        if obj.pk is not None:
+            bundle = self.full_dehydrate(bundle)
+
+        bundle.data.update(dict_strip_unicode_keys(data))
+        return bundle
+
+    def prefetch_related(self, request, items):
+        """
+        Loads the documents referenced by URI in ``items`` (the data of the
+        bulk bundles) with one ``$in`` query per related resource.
+
+        Returns a dict keyed by related resource class and primary key, which
+        ``obj_get`` uses while the items are hydrated.
+        """
+        pks = {}
+
+        for field_name, field_object in self.fields.items():
+            if not getattr(field_object, 'is_related', False) or field_object.readonly:
+                continue
+
+            resource_type = field_object.to_class
+
+            if not issubclass(resource_type, DocumentResource):
+                continue
+
+            for data in items:
+                values = data.get(field_name)
+
+                if not isinstance(values, (list, tuple)):
+                    values = [values]
+
+                for value in values:
+                    if isinstance(value, dict):
+                        value = value.get('resource_uri')
+
+                    if not isinstance(value, basestring):
+                        continue
+
+                    try:
+                        pks.setdefault(resource_type, set()).add(resolve(value)[2]['pk'])
+                    except (Resolver404, KeyError):
+                        # Hydration reports the invalid URI.
+                        pass
+
+        prefetched = {}
+
+        for resource_type, resource_pks in pks.items():
+            try:
+                documents = list(resource_type().get_object_list(request).filter(pk__in=list(resource_pks)))
+            except (ValueError, ValidationError):
+                # Invalid ids are reported by hydration as well.
+                continue
+
+            for document in documents:
+                prefetched[(resource_type, str(document.pk))] = document
+
+        return prefetched
+
+    def hydrate_for_bulk_write(self, request, bundle):
+        """
+        Hydrates a single item of a bulk write and validates it. The related
+        documents it creates or changes are collected in
+        ``bundle.related_documents``. Returns the hydrated bundle.
+        """
+        bundle = self.full_hydrate(bundle)
+
+        if hasattr(bundle, 'errors'):
+            self.is_valid(bundle, request)
+
+            if bundle.errors:
+                raise ValidationError(bundle.errors)
+
+        m2m_bundle = self.hydrate_m2m(bundle)
+        related_documents = {}
+        self.collect_m2m(m2m_bundle, related_documents)
+        bundle.obj.validate()
+        bundle.related_documents = related_documents
+        return bundle
+
+    def obj_bulk_write(self, request, objects, ordered=True):
+        """
+        Creates and updates many objects with a few ``bulk_write`` calls.
+
+        ``objects`` is a list of deserialized items. Items with a
+        ``resource_uri`` update the existing object, all other items create a
+        new one. The existing objects are loaded and dereferenced in batches,
+        the related URIs of all items are resolved with one query per related
+        resource. All items are hydrated first, then the (deduplicated)
+        related documents of the items that are written go out with one
+        ``bulk_write`` per collection and finally the objects themselves with
+        a single ``bulk_write``.
+
+        Returns a list with one result per item, either
+        ``{'resource_uri': ...}`` or ``{'error': ...}``. With ``ordered`` the
+        items after the first failing one are not written.
+        """
+        results = [None] * len(objects)
+        pks = {}
+
+        for index, data in enumerate(objects):
+            uri = data.get('resource_uri')
+
+            if uri:
+                try:
+                    pks[index] = resolve(uri)[2]['pk']
+                except (Resolver404, KeyError):
+                    results[index] = {'error': "Could not resolve the resource URI '%s'." % uri}
+
+        existing = {}
+
+        if pks:
+            for obj in self.get_object_list(request).filter(pk__in=pks.values()):
+                existing[str(obj.pk)] = obj
+
+            # Dehydrating the current state must not fetch every reference
+            # on its own.
+            self.dereference_objects(existing.values())
+
+        pending = []
+
+        for index, data in enumerate(objects):
+            if results[index] is not None:
+                continue
+
+            if index in pks:
+                obj = existing.get(str(pks[index]))
+
+                if obj is None:
+                    results[index] = {'error': "A model instance matching the provided arguments could not be found."}
+                    continue
+            else:
+                obj = self._meta.object_class()
+
+            try:
+                pending.append((index, self.build_bulk_bundle(request, data, obj)))
+            except Exception, e:
+                results[index] = {'error': unicode(e)}
+
+        bundles = []
+        previous = getattr(_prefetch_local, 'documents', None)
+        _prefetch_local.documents = self.prefetch_related(request, [bundle.data for index, bundle in pending])
+
+        try:
+            for index, bundle in pending:
+                try:
+                    bundle = self.hydrate_for_bulk_write(request, bundle)
+                except Exception, e:
+                    results[index] = {'error': unicode(e)}
+                    continue
+
+                if bundle.obj.pk is None:
+                    bundle.obj.pk = ObjectId()
+                    bundle.is_new = True
+                else:
+                    bundle.is_new = False
+
+                bundles.append((index, bundle))
+        finally:
+            _prefetch_local.documents = previous
+
+        if ordered:
+            failed = [index for index, result in enumerate(results) if result is not None]
+
+            if failed:
+                bundles = [(index, bundle) for index, bundle in bundles if index < failed[0]]
+
+        # Only the related documents of items that are written are saved.
+        related_documents = {}
+
+        for index, bundle in bundles:
+            related_documents.update(bundle.related_documents)
+
+        with Phase('save_m2m'):
+            self.bulk_write_related(related_documents)
+
+        operations = []
+
+        for index, bundle in bundles:
+            document = bundle.obj.to_mongo()
+
+            if bundle.is_new:
+                operations.append(InsertOne(document))
+            else:
+                operations.append(ReplaceOne({'_id': bundle.obj.pk}, document))
+
+        write_errors = {}
+
+        if operations:
+            try:
+                self._meta.object_class._get_collection().bulk_write(operations, ordered=ordered)
+            except BulkWriteError, e:
+                for error in e.details.get('writeErrors', []):
+                    write_errors[error['index']] = error.get('errmsg')
+
+        first_error = min(write_errors.keys()) if write_errors else None
+
+        for position, (index, bundle) in enumerate(bundles):
+            if position in write_errors:
+                results[index] = {'error': write_errors[position]}
+            elif ordered and first_error is not None and position > first_error:
+                results[index] = {'error': "Not written because of an earlier error."}
+            else:
+                results[index] = {'resource_uri': self.get_resource_uri(bundle)}
+                cache.invalidate(self._meta.object_class, bundle.obj.pk)
+
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = {'error': "Not written because of an earlier error."}
+
+        return results
+
+    def bulk_write_related(self, related_documents):
+        """
+        Writes the related documents collected by ``collect_m2m`` with one
+        unordered ``bulk_write`` per collection.
+        """
+        operations = {}
+
+        for (document_type, pk), document in related_documents.items():
+            operations.setdefault(document_type, []).append(
+                ReplaceOne({'_id': pk}, document.to_mongo(), upsert=True)
+            )
+
+        for document_type, document_operations in operations.items():
+            document_type._get_collection().bulk_write(document_operations, ordered=False)
+
+        # bulk_write does not send signals.
+        for document_type, pk in related_documents.keys():
+            cache.invalidate(document_type, pk)
+
+    def post_list(self, request, **kwargs):
+        """
+        Creates a new resource.
+
+        With ``bulk_writes = True`` on ``Meta`` a payload of
+        ``{"objects": [...]}`` creates (or updates, see ``obj_bulk_write``)
+        all objects at once. ``?ordered=false`` keeps writing after an item
+        failed.
+        """
+        if not getattr(self._meta, 'bulk_writes', False):
+            return super(DocumentResource, self).post_list(request, **kwargs)
+
+        deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+
+        if not isinstance(deserialized, dict) or not isinstance(deserialized.get('objects'), list):
+            return super(DocumentResource, self).post_list(request, **kwargs)
+
+        deserialized = self.alter_deserialized_list_data(request, deserialized)
+
+        # POST only needs the permission to add objects, so it must not
+        # replace existing ones.
+        for data in deserialized['objects']:
+            if isinstance(data, dict) and data.get('resource_uri'):
+                raise BadRequest("Existing objects cannot be updated with POST, use PATCH.")
+
+        results = self.obj_bulk_write(request, deserialized['objects'], ordered=request.GET.get('ordered') != 'false')
+        return self.create_response(request, {'objects': results}, response_class=http.HttpCreated)
+
+    def patch_list(self, request, **kwargs):
+        """
+        Updates, creates and deletes many resources at once.
+
+        With ``bulk_writes = True`` on ``Meta`` the ``objects`` of the payload
+        are written with ``obj_bulk_write`` and all ``deleted_objects`` are
+        removed with a single query.
+        """
+        if not getattr(self._meta, 'bulk_writes', False):
+            return super(DocumentResource, self).patch_list(request, **kwargs)
+
+        deserialized = self.deserialize(request, request.raw_post_data, format=request.META.get('CONTENT_TYPE', 'application/json'))
+        deserialized = self.alter_deserialized_list_data(request, deserialized)
+
+        if not 'objects' in deserialized:
+            raise BadRequest("Invalid data sent.")
+
+        # Updates and deletes need the detail methods, like they do in
+        # tastypie's ``patch_list``.
+        if any(isinstance(data, dict) and data.get('resource_uri') for data in deserialized['objects']) and \
+                not 'put' in self._meta.detail_allowed_methods:
+            raise ImmediateHttpResponse(response=http.HttpMethodNotAllowed())
+
+        if deserialized.get('deleted_objects') and not 'delete' in self._meta.detail_allowed_methods:
+            raise ImmediateHttpResponse(response=http.HttpMethodNotAllowed())
+
+        # Resolve all deleted objects before anything is written.
+        pks = []
+
+        id_field = self._meta.object_class._fields[self._meta.object_class._meta['id_field']]
+
+        for uri in deserialized.get('deleted_objects', []):
+            try:
+                view_kwargs = resolve(uri)[2]
+
+                if view_kwargs.get('resource_name') != self._meta.resource_name:
+                    raise KeyError('resource_name')
+
+                id_field.validate(id_field.to_python(view_kwargs['pk']))
+                pks.append(view_kwargs['pk'])
+            except (Resolver404, KeyError, ValidationError):
+                raise BadRequest("Could not resolve the resource URI '%s'." % uri)
+
+        results = self.obj_bulk_write(request, deserialized['objects'], ordered=request.GET.get('ordered') != 'false')
+
+        if pks:
+            self.get_object_list(request).filter(pk__in=pks).delete()
+
+        return self.create_response(request, {'objects': results}, response_class=http.HttpAccepted)
@@ -0,0 +1,140 @@
+import datetime
+import decimal
+import json
+
+# ujson 1.x rounds floats, so it is not used.
+try:
+    import simplejson as fast_json
+except ImportError:
+    fast_json = json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from bson import BSON, DBRef, ObjectId
+
+try:
+    from bson.decimal128 import Decimal128
+except ImportError:
+    # pymongo < 3.4
+    Decimal128 = None
+
+from django.utils.encoding import force_unicode
+
+from tastypie.bundle import Bundle
+from tastypie.serializers import Serializer
+
+# Types that are passed to the JSON and msgpack encoders as they are.
+SIMPLE_TYPES = (basestring, bool, int, long, float)
+
+# Types BSON can encode without converting them first.
+BSON_TYPES = SIMPLE_TYPES + (ObjectId, datetime.datetime)
+
+class DocumentSerializer(Serializer):
+    """
+    A serializer for the data of ``DocumentResource`` s.
+
+    JSON is written with ``simplejson`` (and its C speedups) when it is
+    installed and with python's ``json`` otherwise. Besides tastypie's
+    formats responses can be sent as MessagePack (``application/x-msgpack``,
+    needs ``msgpack``) and BSON (``application/bson``) and requests in those
+    formats are deserialized.
+
+    ``ObjectId`` s are written as strings and ``Decimal`` s as strings, except
+    in BSON, which keeps ``ObjectId`` s, datetimes and ``Decimal`` s (as
+    ``Decimal128``) in their own types.
+    """
+    formats = ['json', 'jsonp', 'xml', 'yaml', 'html', 'plist', 'msgpack', 'bson']
+    content_types = dict(Serializer.content_types, **{
+        'msgpack': 'application/x-msgpack',
+        'bson': 'application/bson',
+    })
+
+    def __init__(self, formats=None, content_types=None, datetime_formatting=None):
+        formats = formats or self.formats
+
+        # msgpack is optional.
+        if msgpack is None:
+            formats = [format for format in formats if format != 'msgpack']
+
+        super(DocumentSerializer, self).__init__(formats=formats, content_types=content_types, datetime_formatting=datetime_formatting)
+
+    def to_simple(self, data, options):
+        """
+        Converts ``data`` to types the encoders understand.
+
+        Handles the types found in dehydrated documents directly and leaves
+        everything else to tastypie. ``native_types`` in ``options`` are kept
+        as they are.
+        """
+        native_types = options.get('native_types', SIMPLE_TYPES)
+
+        if data is None or isinstance(data, native_types):
+            return data
+
+        if isinstance(data, Bundle):
+            data = data.data
+
+        if isinstance(data, dict):
+            return dict((key, self.to_simple(value, options)) for key, value in data.iteritems())
+
+        if isinstance(data, (list, tuple)):
+            return [self.to_simple(item, options) for item in data]
+
+        if isinstance(data, ObjectId):
+            return str(data)
+
+        if isinstance(data, DBRef):
+            return self.to_simple(data.id, options)
+
+        if isinstance(data, decimal.Decimal):
+            if Decimal128 is not None and Decimal128 in native_types:
+                return Decimal128(data)
+
+            return str(data)
+
+        if isinstance(data, datetime.datetime):
+            return self.format_datetime(data)
+
+        if isinstance(data, datetime.date):
+            return self.format_date(data)
+
+        if isinstance(data, datetime.time):
+            return self.format_time(data)
+
+        if hasattr(data, 'dehydrated_type'):
+            return super(DocumentSerializer, self).to_simple(data, options)
+
+        return force_unicode(data)
+
+    def to_json(self, data, options=None):
+        options = options or {}
+        return fast_json.dumps(self.to_simple(data, options))
+
+    def from_json(self, content):
+        return fast_json.loads(content)
+
+    def to_msgpack(self, data, options=None):
+        options = options or {}
+        return msgpack.packb(self.to_simple(data, options), use_bin_type=True)
+
+    def from_msgpack(self, content):
+        return msgpack.unpackb(content, raw=False)
+
+    def to_bson(self, data, options=None):
+        options = dict(options or {})
+        native_types = BSON_TYPES
+
+        if Decimal128 is not None:
+            native_types += (Decimal128,)
+
+        options['native_types'] = native_types
+        return BSON.encode(self.to_simple(data, options))
+
+    def from_bson(self, content):
+        data = BSON(content).decode()
+
+        # Sent data is hydrated like JSON, so ids have to be strings again.
+        return self.to_simple(data, {})
@@ -0,0 +1,14 @@
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(DEBUG=False, SECRET_KEY='mangopie-tests', ROOT_URLCONF='tests.api')
+
+import django
+
+if hasattr(django, 'setup'):
+    django.setup()
+
+import mongoengine
+
+# The tests run against mongomock, no mongod is needed.
+mongoengine.connect('mangopie_tests', host='mongomock://localhost')
@@ -0,0 +1,61 @@
+"""
+Documents and resources used by the tests, also the URL conf.
+"""
+try:
+    from django.conf.urls import include, url
+except ImportError:
+    # Django < 1.4
+    from django.conf.urls.defaults import include, url
+
+from tastypie.api import Api
+
+from mongoengine import Document, EmbeddedDocument
+from mongoengine import EmbeddedDocumentField, FileField, IntField, ListField, StringField
+
+from mangopie.resources import DocumentResource
+
+class Comment(EmbeddedDocument):
+    text = StringField()
+    likes = IntField(default=0)
+
+class Entry(Document):
+    title = StringField()
+    views = IntField()
+    tags = ListField(StringField())
+    comments = ListField(EmbeddedDocumentField(Comment))
+    main = EmbeddedDocumentField(Comment)
+    status = StringField(default='draft')
+
+class Attachment(Document):
+    title = StringField()
+    content = FileField()
+
+class EntryResource(DocumentResource):
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'entry'
+        filtering = {
+            'title': ['exact'],
+            'views': ['exact', 'gt', 'lt'],
+            'tags': ['exact', 'in'],
+        }
+
+class RawEntryResource(DocumentResource):
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'raw_entry'
+        raw_reads = True
+
+class AttachmentResource(DocumentResource):
+    class Meta:
+        queryset = Attachment.objects()
+        resource_name = 'attachment'
+
+v1 = Api(api_name='v1')
+
+for resource_class in (EntryResource, RawEntryResource, AttachmentResource):
+    v1.register(resource_class())
+
+urlpatterns = [
+    url(r'^api/', include(v1.urls)),
+]
@@ -0,0 +1,65 @@
+import unittest
+
+from django.test.client import RequestFactory
+
+from mangopie.authorization import DjangoAuthorization
+from mangopie.resources import DocumentResource
+
+from tests.api import Entry
+
+class User(object):
+    """
+    A user whose permissions come from a backend that only implements
+    ``has_perm``.
+    """
+    pk = 1
+
+    def __init__(self, *permissions):
+        self.permissions = permissions
+        self.checked = []
+
+    def has_perm(self, permission_code):
+        self.checked.append(permission_code)
+        return permission_code in self.permissions
+
+class AuthorizedEntryResource(DocumentResource):
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'authorized_entry'
+        authorization = DjangoAuthorization()
+
+class DjangoAuthorizationTestCase(unittest.TestCase):
+    def setUp(self):
+        Entry.drop_collection()
+        self.entry = Entry(title='a').save()
+        self.resource = AuthorizedEntryResource()
+
+    def tearDown(self):
+        Entry.drop_collection()
+
+    def get_request(self, method, user):
+        request = getattr(RequestFactory(), method)('/api/v1/authorized_entry/')
+        request.user = user
+        return request
+
+    def test_has_perm(self):
+        user = User('tests.change_entry')
+        request = self.get_request('put', user)
+
+        authorization = self.resource._meta.authorization
+
+        self.assertTrue(authorization.is_authorized(request))
+        self.assertTrue(authorization.is_authorized(request))
+        self.assertEqual(user.checked, ['tests.change_entry'])
+
+        self.assertFalse(authorization.is_authorized(self.get_request('post', user)))
+
+    def test_related_reads(self):
+        # Resolving a reference while another resource is written only needs
+        # the objects to be readable.
+        request = self.get_request('post', User())
+        self.assertEqual(self.resource.obj_get(request, pk=self.entry.pk).title, 'a')
+        self.assertEqual(len(self.resource.get_object_list(request)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from django.http import QueryDict
+from django.test.client import RequestFactory
+
+from tests.api import Entry, EntryResource
+
+class FilterTestCase(unittest.TestCase):
+    def setUp(self):
+        Entry.drop_collection()
+        Entry(title='ab', views=1, tags=['t1', 'x']).save()
+        Entry(title='t1', views=2, tags=['t1']).save()
+        Entry(title='x', views=3, tags=['x', 't1']).save()
+        self.resource = EntryResource()
+
+    def tearDown(self):
+        Entry.drop_collection()
+
+    def get_titles(self, query_string):
+        request = RequestFactory().get('/api/v1/entry/?%s' % query_string)
+        return sorted(entry.title for entry in self.resource.obj_get_list(request))
+
+    def test_exact_is_equality(self):
+        self.assertEqual(self.resource.build_filters(QueryDict('title=ab')), {'title': u'ab'})
+        self.assertEqual(self.resource.build_filters(QueryDict('title__not=ab')), {'title__ne': u'ab'})
+        self.assertEqual(self.get_titles('title=ab'), ['ab'])
+        self.assertEqual(self.get_titles('title=a'), [])
+
+    def test_list_element(self):
+        self.assertEqual(self.resource.build_filters(QueryDict('tags=t1')), {'tags': u't1'})
+        self.assertEqual(self.get_titles('tags=t1'), ['ab', 't1', 'x'])
+
+    def test_list_comma_separated(self):
+        self.assertEqual(self.resource.build_filters(QueryDict('tags=t1,x')), {'tags': [u't1', u'x']})
+        self.assertEqual(self.get_titles('tags=t1,x'), ['ab'])
+
+    def test_list_repeated(self):
+        self.assertEqual(self.resource.build_filters(QueryDict('tags=t1&tags=x')), {'tags': [u't1', u'x']})
+        self.assertEqual(self.get_titles('tags=t1&tags=x'), ['ab'])
+
+    def test_list_in(self):
+        self.assertEqual(self.get_titles('tags__in=x,y'), ['ab', 'x'])
+
+    def test_coercion(self):
+        self.assertEqual(self.resource.build_filters(QueryDict('views__gt=1')), {'views__gt': 1})
+        self.assertEqual(self.get_titles('views__gt=1'), ['t1', 'x'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import urlparse
+
+from mangopie.paginator import CursorPaginator
+
+from tests.api import Entry
+
+class CursorPaginatorTestCase(unittest.TestCase):
+    def setUp(self):
+        Entry.drop_collection()
+        self.entries = [Entry(title='E%s' % i, views=i % 3).save() for i in range(7)]
+
+    def tearDown(self):
+        Entry.drop_collection()
+
+    def get_pages(self, objects, limit=2):
+        pages = []
+        request_data = {}
+
+        # Stop after more pages than there are entries if paging never ends.
+        for i in range(len(self.entries) + 1):
+            page = CursorPaginator(request_data, objects, resource_uri='/api/v1/entry/', limit=limit).page()
+            pages.append([entry.title for entry in page['objects']])
+
+            if not page['meta']['next']:
+                break
+
+            query = urlparse.parse_qs(urlparse.urlparse(page['meta']['next']).query)
+            request_data = {'cursor': query['cursor'][0]}
+
+        return pages
+
+    def test_default_order(self):
+        pages = self.get_pages(Entry.objects())
+        self.assertEqual(pages, [['E0', 'E1'], ['E2', 'E3'], ['E4', 'E5'], ['E6']])
+
+    def test_ascending(self):
+        pages = self.get_pages(Entry.objects().order_by('views'))
+        self.assertEqual(pages, [['E0', 'E3'], ['E6', 'E1'], ['E4', 'E2'], ['E5']])
+
+    def test_descending(self):
+        pages = self.get_pages(Entry.objects().order_by('-views'))
+        self.assertEqual(pages, [['E5', 'E2'], ['E4', 'E1'], ['E6', 'E3'], ['E0']])
+
+    def test_missing_sort_keys(self):
+        for entry in self.entries[1::2]:
+            Entry.objects(pk=entry.pk).update_one(unset__views=True)
+
+        ascending = sum(self.get_pages(Entry.objects().order_by('views')), [])
+        self.assertEqual(ascending, ['E1', 'E3', 'E5', 'E0', 'E6', 'E4', 'E2'])
+
+        descending = sum(self.get_pages(Entry.objects().order_by('-views')), [])
+        self.assertEqual(descending, ['E2', 'E4', 'E6', 'E0', 'E5', 'E3', 'E1'])
+
+if __name__ == '__main__':
+    unittest.main()
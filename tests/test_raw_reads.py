@@ -0,0 +1,81 @@
+import json
+import unittest
+
+from django.test.client import RequestFactory
+
+from tastypie import fields as tasty_fields
+
+from tests.api import Comment, Entry, EntryResource, RawEntryResource
+
+class StatusEntryResource(EntryResource):
+    # Without a default of its own the field shows the document's value.
+    status = tasty_fields.CharField(attribute='status', null=True)
+
+class RawStatusEntryResource(RawEntryResource):
+    status = tasty_fields.CharField(attribute='status', null=True)
+
+class UnprojectedStatusEntryResource(StatusEntryResource):
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'entry'
+        projection = False
+
+class RawUnprojectedStatusEntryResource(RawStatusEntryResource):
+    class Meta:
+        queryset = Entry.objects()
+        resource_name = 'raw_entry'
+        raw_reads = True
+        projection = False
+
+class RawReadsTestCase(unittest.TestCase):
+    def setUp(self):
+        Entry.drop_collection()
+        Entry(title='a', views=1, tags=['x'], comments=[Comment(text='c', likes=1)], main=Comment(text='m', likes=2)).save()
+        Entry._get_collection().insert_one({'title': 'b', 'comments': [{'text': 'd'}], 'status': None})
+        Entry._get_collection().insert_one({})
+
+    def tearDown(self):
+        Entry.drop_collection()
+
+    def get_objects(self, resource_type, query_string=''):
+        request = RequestFactory().get('/api/v1/entry/?%s' % query_string, HTTP_ACCEPT='application/json')
+        response = resource_type().get_list(request)
+        return json.loads(''.join(response))['objects']
+
+    def assert_same_output(self, normal_type, raw_type, query_string=''):
+        normal = self.get_objects(normal_type, query_string)
+        raw = self.get_objects(raw_type, query_string)
+
+        for obj in normal + raw:
+            obj.pop('resource_uri')
+
+        self.assertEqual(raw, normal)
+        return raw
+
+    def test_embedded_documents(self):
+        objects = self.assert_same_output(EntryResource, RawEntryResource)
+        self.assertEqual(objects[0]['comments'], [{'text': 'c', 'likes': 1}])
+        self.assertEqual(objects[0]['main'], {'text': 'm', 'likes': 2})
+        self.assertEqual(objects[1]['comments'], [{'text': 'd', 'likes': 0}])
+
+    def test_missing_fields(self):
+        # mongoengine sets the default of loaded fields that are null, but
+        # not of those missing in projected queries.
+        objects = self.assert_same_output(StatusEntryResource, RawStatusEntryResource)
+        self.assertEqual([obj['status'] for obj in objects], ['draft', 'draft', None])
+        self.assertEqual(objects[2]['tags'], [])
+
+    def test_missing_fields_unprojected(self):
+        objects = self.assert_same_output(UnprojectedStatusEntryResource, RawUnprojectedStatusEntryResource)
+        self.assertEqual([obj['status'] for obj in objects], ['draft'] * 3)
+
+    def test_requested_fields(self):
+        objects = self.assert_same_output(EntryResource, RawEntryResource, 'fields=title')
+        self.assertEqual(objects, [{'title': 'a'}, {'title': 'b'}, {'title': None}])
+
+        # The id is still loaded for the URI.
+        uris = [obj['resource_uri'] for obj in self.get_objects(RawEntryResource, 'fields=title')]
+        self.assertTrue(all(uri.endswith('/') and len(uri) > len('/api/v1/raw_entry/') for uri in uris))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+
+from mangopie import fields
+from mangopie.resources import DocumentResource
+
+from tests.api import Attachment, AttachmentResource, Comment, Entry, EntryResource
+
+class DocumentResourceTestCase(unittest.TestCase):
+    def test_file_fields(self):
+        self.assertTrue(isinstance(AttachmentResource.base_fields['content'], fields.FileField))
+        self.assertEqual(AttachmentResource._meta.file_fields, ['content'])
+
+    def test_file_url(self):
+        names = [pattern.name for pattern in AttachmentResource().override_urls()]
+        self.assertEqual(names, ['api_dispatch_file'])
+
+    def test_fields_option(self):
+        class TitleResource(DocumentResource):
+            class Meta:
+                queryset = Attachment.objects()
+                resource_name = 'title'
+                fields = ['title']
+
+        self.assertEqual(sorted(TitleResource.base_fields), ['resource_uri', 'title'])
+        self.assertEqual(TitleResource._meta.file_fields, [])
+
+    def test_subclass_embedded_field(self):
+        class SubEntryResource(EntryResource):
+            pass
+
+        bundle = SubEntryResource().build_bundle(obj=Entry(main=Comment(text='m')))
+        self.assertEqual(SubEntryResource().full_dehydrate(bundle).data['main'].data, {'text': 'm', 'likes': 0})
+
+if __name__ == '__main__':
+    unittest.main()
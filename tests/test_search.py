@@ -0,0 +1,47 @@
+import unittest
+
+from tastypie.exceptions import TastypieError
+
+from mongoengine import Document, StringField
+
+from mangopie.resources import DocumentResource
+
+class Article(Document):
+    title = StringField()
+    body = StringField()
+    author = StringField()
+
+    meta = {
+        'indexes': [{'fields': ['$title', '$body']}],
+    }
+
+class Note(Document):
+    text = StringField()
+
+def create_resource(document_type, search_fields):
+    class Meta:
+        queryset = document_type.objects()
+        resource_name = document_type.__name__.lower()
+
+    Meta.search_fields = search_fields
+    return type('SearchResource', (DocumentResource,), {'Meta': Meta})
+
+class SearchFieldsTestCase(unittest.TestCase):
+    def test_indexed_fields(self):
+        resource_type = create_resource(Article, ['title', 'body'])
+        self.assertEqual(resource_type._meta.search_fields, ['title', 'body'])
+
+    def test_field_not_in_index(self):
+        self.assertRaises(TastypieError, create_resource, Article, ['title', 'author'])
+
+    def test_unknown_field(self):
+        self.assertRaises(TastypieError, create_resource, Article, ['summary'])
+
+    def test_no_text_index(self):
+        self.assertRaises(TastypieError, create_resource, Note, ['text'])
+
+    def test_no_search_fields(self):
+        create_resource(Note, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import datetime
+import decimal
+import unittest
+
+from bson import BSON, ObjectId
+
+from tastypie.bundle import Bundle
+
+from mangopie import serializers
+from mangopie.serializers import DocumentSerializer
+
+class SerializerRoundTripTestCase(unittest.TestCase):
+    def setUp(self):
+        self.serializer = DocumentSerializer()
+        self.id = ObjectId()
+        self.created = datetime.datetime(2012, 5, 17, 13, 37, 42)
+        self.price = decimal.Decimal('12.50')
+
+        self.data = {
+            'id': self.id,
+            'created': self.created,
+            'price': self.price,
+            'ratio': 0.1 + 0.2,
+            'title': u'Mangø',
+            'tags': [u'a', u'b'],
+            'author': {'id': self.id, 'born': self.created},
+        }
+
+    def assert_simple(self, data):
+        self.assertEqual(data['id'], str(self.id))
+        self.assertEqual(data['created'], self.serializer.format_datetime(self.created))
+        self.assertEqual(data['price'], '12.50')
+        self.assertEqual(data['ratio'], 0.1 + 0.2)
+        self.assertEqual(data['title'], u'Mangø')
+        self.assertEqual(data['tags'], [u'a', u'b'])
+        self.assertEqual(data['author'], {
+            'id': str(self.id),
+            'born': self.serializer.format_datetime(self.created),
+        })
+
+    def test_json(self):
+        content = self.serializer.to_json(self.data)
+        self.assert_simple(self.serializer.from_json(content))
+
+    def test_json_keeps_float_precision(self):
+        content = self.serializer.to_json({'ratio': 0.1 + 0.2})
+        self.assertEqual(self.serializer.from_json(content)['ratio'], 0.30000000000000004)
+
+    @unittest.skipIf(serializers.msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        content = self.serializer.to_msgpack(self.data)
+        self.assert_simple(self.serializer.from_msgpack(content))
+
+    def test_bson(self):
+        content = self.serializer.to_bson(self.data)
+        self.assert_simple(self.serializer.from_bson(content))
+
+    def test_bson_keeps_native_types(self):
+        data = BSON(self.serializer.to_bson(self.data)).decode()
+
+        self.assertEqual(data['id'], self.id)
+        self.assertEqual(data['created'], self.created)
+        self.assertEqual(data['author']['id'], self.id)
+
+        if serializers.Decimal128 is not None:
+            self.assertEqual(data['price'], serializers.Decimal128(self.price))
+        else:
+            self.assertEqual(data['price'], '12.50')
+
+    def test_bundle(self):
+        bundle = Bundle(data=self.data)
+
+        for format in self.serializer.formats:
+            if format not in ('json', 'msgpack', 'bson'):
+                continue
+
+            content_type = self.serializer.content_types[format]
+            content = self.serializer.serialize(bundle, format=content_type)
+            self.assert_simple(self.serializer.deserialize(content, format=content_type))
+
+    def test_formats(self):
+        self.assertTrue('application/bson' in self.serializer.supported_formats)
+        self.assertEqual('application/x-msgpack' in self.serializer.supported_formats, serializers.msgpack is not None)
+
+if __name__ == '__main__':
+    unittest.main()